@@ -1,18 +1,46 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 import uuid
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 import httpx
 import asyncio
+import numpy as np
+import base64
+import bisect
+import gzip
+import hashlib
+import heapq
+import importlib.util
+import itertools
+import json
+import math
+import re
+import unicodedata
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -32,6 +60,108 @@ FOOTBALL_DATA_BASE = "https://api.football-data.org/v4"
 ODDS_API_BASE = "https://api.the-odds-api.com/v4"
 API_BASKETBALL_BASE = "https://v1.basketball.api-sports.io"
 
+# Shared upstream HTTP clients - one pooled client per host, kept alive for the app's lifetime
+HTTP2_ENABLED = os.environ.get('HTTP2_ENABLED', 'true').lower() == 'true'
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '20'))
+HTTP_MAX_KEEPALIVE = int(os.environ.get('HTTP_MAX_KEEPALIVE', '10'))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '60'))
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None  # httpx needs h2 for HTTP/2
+
+UPSTREAM_HOSTS = ("football_data", "odds_api", "api_basketball")
+http_clients: Dict[str, httpx.AsyncClient] = {}
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create a pooled client with keep-alive and, when h2 is installed, HTTP/2"""
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=30.0,
+    )
+
+def get_http_client(host: str) -> httpx.AsyncClient:
+    """Get the shared client for an upstream host (created lazily if startup hasn't run)"""
+    http_client = http_clients.get(host)
+    if http_client is None or http_client.is_closed:
+        http_client = create_http_client()
+        http_clients[host] = http_client
+    return http_client
+
+# Per-provider request budgets (concurrency + requests per minute)
+class UpstreamBudgetExceeded(Exception):
+    """Raised when an upstream call would have to wait too long for its provider budget"""
+
+class ProviderBudget:
+    """Caps in-flight requests and requests per rolling minute for one upstream provider"""
+
+    def __init__(self, name: str, max_concurrent: int, per_minute: int, max_wait: float = 15.0):
+        self.name = name
+        self.per_minute = per_minute
+        self.max_wait = max_wait
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.blocked_until = 0.0
+        self._calls: deque = deque()
+        self._lock = asyncio.Lock()
+
+    def backoff(self, seconds: float):
+        """Stop sending requests for a while, e.g. after a 429"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def _wait_for_rate(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= 60:
+                    self._calls.popleft()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif len(self._calls) < self.per_minute:
+                    self._calls.append(now)
+                    return
+                else:
+                    wait = 60 - (now - self._calls[0])
+                if wait > self.max_wait:
+                    raise UpstreamBudgetExceeded(f"{self.name} request budget exhausted, retry in {wait:.0f}s")
+                await asyncio.sleep(wait)
+
+    def headroom(self) -> int:
+        """Requests that could start right now without waiting"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return 0
+        return self.per_minute - sum(1 for t in self._calls if now - t < 60)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.semaphore:
+            await self._wait_for_rate()
+            yield
+
+provider_budgets = {
+    "football_data": ProviderBudget(
+        "Football-Data.org",
+        int(os.environ.get('FOOTBALL_DATA_MAX_CONCURRENT', '8')),
+        int(os.environ.get('FOOTBALL_DATA_RATE_PER_MIN', '10')),
+    ),
+    "odds_api": ProviderBudget(
+        "The Odds API",
+        int(os.environ.get('ODDS_API_MAX_CONCURRENT', '8')),
+        int(os.environ.get('ODDS_API_RATE_PER_MIN', '30')),
+    ),
+    "api_basketball": ProviderBudget(
+        "API-Basketball",
+        int(os.environ.get('API_BASKETBALL_MAX_CONCURRENT', '4')),
+        int(os.environ.get('API_BASKETBALL_RATE_PER_MIN', '10')),
+    ),
+}
+
+# Fetch all leagues concurrently in GET /api/matches (set to false for one-at-a-time fetching)
+CONCURRENT_LEAGUE_FETCH = os.environ.get('CONCURRENT_LEAGUE_FETCH', 'true').lower() == 'true'
+
 # Create the main app
 app = FastAPI()
 
@@ -45,9 +175,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Simple in-memory cache
-cache = {}
-CACHE_TTL = 300  # 5 minutes
+# In-memory cache limits
+CACHE_TTL = 300  # 5 minutes (default for keys outside a known namespace)
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '2000'))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))  # 64 MB
+# How long past its TTL an entry may still be served while a refresh runs (stale-while-revalidate)
+CACHE_STALE_GRACE = int(os.environ.get('CACHE_STALE_GRACE', '900'))
+
+# Per-namespace TTLs (seconds), matched on the cache key prefix
+CACHE_NAMESPACE_TTLS = {
+    "fd:": int(os.environ.get('CACHE_TTL_FOOTBALL_DATA', '300')),
+    "odds:": int(os.environ.get('CACHE_TTL_ODDS', '300')),
+    "basketball:": int(os.environ.get('CACHE_TTL_BASKETBALL', '300')),
+    "basketball_odds:": int(os.environ.get('CACHE_TTL_BASKETBALL_ODDS', '300')),
+    "ai:": int(os.environ.get('AI_ANALYSIS_TTL', str(6 * 3600))),
+    "news:": int(os.environ.get('NEWS_CACHE_TTL', str(3 * 3600))),
+}
 
 # Football-Data.org League codes mapped to The Odds API sport keys
 FOOTBALL_LEAGUES = {
@@ -92,10 +235,29 @@ class ParlayItem(BaseModel):
     selection: Optional[str] = None  # Backward compatibility
     price: Optional[float] = None
     odds: Optional[float] = None  # Backward compatibility
+    market: Optional[str] = None  # 1X2, Over/Under, BTTS, Handicap
     match_name: str
 
 class ParlayRequest(BaseModel):
     items: List[ParlayItem]
+    stake: float = 10
+    simulations: Optional[int] = None
+
+class TeamAlias(BaseModel):
+    alias: str
+    canonical: str
+
+class BatchAnalysisRequest(BaseModel):
+    matches: List[Dict[str, Any]]
+
+class ParlayOptimizeRequest(BaseModel):
+    legs: int = 3
+    min_odds: float = 1.2  # per leg
+    max_per_league: Optional[int] = None
+    target_probability: Optional[float] = None  # minimum parlay win probability, %
+    objective: str = "ev"  # "ev" or "kelly"
+    sport: Optional[str] = None
+    results: int = 5
 
 class ParlayResponse(BaseModel):
     items: List[ParlayItem]
@@ -103,18 +265,378 @@ class ParlayResponse(BaseModel):
     probability: float
     potential_return: float
     risk_assessment: str
+    simulation: Optional[Dict[str, Any]] = None
+
+def estimate_size(data: Any) -> int:
+    """Rough byte size of a JSON-like value (walks dicts/lists without recursion)"""
+    size = 0
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            size += 64
+            for k, v in item.items():
+                size += 16 + (len(k) if isinstance(k, str) else 8)
+                stack.append(v)
+        elif isinstance(item, (list, tuple)):
+            size += 56 + 8 * len(item)
+            stack.extend(item)
+        elif isinstance(item, str):
+            size += 49 + len(item)
+        else:
+            size += 24
+    return size
+
+class TTLCache:
+    """Bounded LRU cache with per-namespace TTLs and a byte budget.
+
+    Entries are evicted least-recently-used first once either the entry
+    count or the estimated byte size goes over its limit. An entry past
+    its TTL is no longer returned by get(), but get_stale() still serves
+    it for stale_grace seconds while a refresh is in flight; after that it
+    is dropped when read and whenever room is needed.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, namespace_ttls: Dict[str, int], default_ttl: int, stale_grace: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_grace = stale_grace
+        # Longest prefix first so "basketball_odds:" wins over "basketball:"
+        self.namespace_ttls = sorted(namespace_ttls.items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_ttl = default_ttl
+        # key -> (data, stored_at, size, version); versions increase on every set
+        self._entries: "OrderedDict[str, Tuple[Any, float, int, int]]" = OrderedDict()
+        self._versions = itertools.count(1)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def ttl_for(self, key: str) -> int:
+        for prefix, ttl in self.namespace_ttls:
+            if key.startswith(prefix):
+                return ttl
+        return self.default_ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        data, stored_at, _, _ = entry
+        age = time.time() - stored_at
+        ttl = self.ttl_for(key)
+        if age >= ttl:
+            if age >= ttl + self.stale_grace:
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Get an expired entry that is still within the stale grace window"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        data, stored_at, _, _ = entry
+        if time.time() - stored_at >= self.ttl_for(key) + self.stale_grace:
+            return None
+        self._entries.move_to_end(key)
+        self.stale_hits += 1
+        return data
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Get an entry (fresh or stale) without touching LRU order or counters"""
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def peek_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(data, stored_at) of an entry (fresh or stale) without touching LRU order or counters"""
+        entry = self._entries.get(key)
+        return (entry[0], entry[1]) if entry else None
+
+    def version(self, key: str, data: Any) -> Optional[int]:
+        """Version of the entry if it still holds this exact data object, else None"""
+        entry = self._entries.get(key)
+        return entry[3] if entry and entry[0] is data else None
+
+    def age(self, key: str) -> Optional[float]:
+        """Seconds since the entry was stored, or None if it isn't cached"""
+        entry = self._entries.get(key)
+        return time.time() - entry[1] if entry else None
+
+    def set(self, key: str, data: Any, stored_at: Optional[float] = None):
+        size = estimate_size(data)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            logger.warning(f"Cache entry {key} ({size} bytes) exceeds the cache byte budget, not stored")
+            return
+        self._entries[key] = (data, stored_at or time.time(), size, next(self._versions))
+        self.total_bytes += size
+        self._evict()
+
+    def _remove(self, key: str):
+        _, _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def _evict(self):
+        if len(self._entries) <= self.max_entries and self.total_bytes <= self.max_bytes:
+            return
+        # Entries past their stale grace go first, then least recently used
+        now = time.time()
+        for key in [k for k, (_, stored_at, _, _) in self._entries.items() if now - stored_at >= self.ttl_for(k) + self.stale_grace]:
+            self._remove(key)
+            self.expirations += 1
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_NAMESPACE_TTLS, CACHE_TTL, CACHE_STALE_GRACE)
 
 def get_cache(key: str) -> Optional[Any]:
     """Get from cache if not expired"""
-    if key in cache:
-        data, timestamp = cache[key]
-        if datetime.now().timestamp() - timestamp < CACHE_TTL:
+    return cache.get(key)
+
+def set_cache(key: str, data: Any):
+    """Set cache with timestamp (written through to the MongoDB L2 cache)"""
+    stored_at = time.time()
+    cache.set(key, data, stored_at)
+    if L2_CACHE_ENABLED and key.startswith(L2_CACHE_NAMESPACES):
+        task = asyncio.ensure_future(l2_set(key, data, stored_at))
+        l2_write_tasks.add(task)
+        task.add_done_callback(l2_write_tasks.discard)
+
+# Second-level cache in MongoDB, shared by all workers and kept across restarts
+L2_CACHE_ENABLED = os.environ.get('L2_CACHE_ENABLED', 'true').lower() == 'true'
+L2_CACHE_NAMESPACES = ("fd:", "odds:", "basketball:", "basketball_odds:", "news:")
+L2_SCHEMA_VERSION = 3  # bump when cached payload shapes change; older documents read as misses
+L2_CACHE_TIMEOUT = float(os.environ.get('L2_CACHE_TIMEOUT', '0.5'))  # seconds per lookup
+L2_CACHE_COOLDOWN = 60  # seconds to skip L2 after a MongoDB error
+l2_stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+l2_disabled_until = 0.0
+l2_write_tasks: set = set()
+
+def l2_available() -> bool:
+    return L2_CACHE_ENABLED and time.time() >= l2_disabled_until
+
+def l2_failed(e: Exception):
+    global l2_disabled_until
+    l2_stats["errors"] += 1
+    l2_disabled_until = time.time() + L2_CACHE_COOLDOWN
+    logger.warning(f"L2 cache unavailable, skipping it for {L2_CACHE_COOLDOWN}s: {e}")
+
+async def l2_get(key: str) -> Optional[Tuple[Any, float]]:
+    """Get (data, stored_at) from the MongoDB cache, or None"""
+    if not l2_available() or not key.startswith(L2_CACHE_NAMESPACES):
+        return None
+    try:
+        doc = await asyncio.wait_for(db.upstream_cache.find_one({"_id": key}), L2_CACHE_TIMEOUT)
+    except Exception as e:
+        l2_failed(e)
+        return None
+    if (not doc or doc.get("schema") != L2_SCHEMA_VERSION
+            or time.time() - doc["stored_at"] >= cache.ttl_for(key) + CACHE_STALE_GRACE):
+        l2_stats["misses"] += 1
+        return None
+    l2_stats["hits"] += 1
+    return json.loads(doc["payload"]), doc["stored_at"]
+
+async def l2_set(key: str, data: Any, stored_at: float):
+    if not l2_available():
+        return
+    # Stored as a JSON string: upstream payloads can have keys MongoDB won't accept as field names
+    expires_at = datetime.fromtimestamp(stored_at + cache.ttl_for(key) + CACHE_STALE_GRACE, timezone.utc)
+    try:
+        await db.upstream_cache.replace_one(
+            {"_id": key},
+            {"_id": key, "payload": json.dumps(data), "stored_at": stored_at, "expires_at": expires_at,
+             "schema": L2_SCHEMA_VERSION},
+            upsert=True,
+        )
+        l2_stats["writes"] += 1
+    except Exception as e:
+        l2_failed(e)
+
+# Upstream calls currently in flight, keyed on their cache key
+inflight_fetches: Dict[str, "asyncio.Task"] = {}
+single_flight_stats = {"upstream_calls": 0, "coalesced": 0}
+
+async def single_flight(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Run fetch() once per key; concurrent callers for the same key await the same result.
+
+    The upstream call runs as its own task, so a caller that disconnects
+    does not cancel the fetch for everyone else waiting on it.
+    """
+    return await asyncio.shield(start_flight(key, fetch))
+
+def start_flight(key: str, fetch: Callable[[], Awaitable[Any]]) -> "asyncio.Task":
+    """Start fetch() for a key unless a call for it is already in flight; returns the shared task"""
+    task = inflight_fetches.get(key)
+    if task is None:
+        single_flight_stats["upstream_calls"] += 1
+        task = asyncio.ensure_future(fetch())
+        inflight_fetches[key] = task
+        task.add_done_callback(lambda _: inflight_fetches.pop(key, None))
+    else:
+        single_flight_stats["coalesced"] += 1
+    return task
+
+async def read_through(key: str, fetch: Callable[[], Awaitable[Any]]) -> Optional[Any]:
+    """Check L1, then L2; serve a stale entry while fetch() refreshes it in the background.
+    
+    Returns None when the caller has to go upstream."""
+    cached = get_cache(key)
+    if cached:
+        return cached
+    l2_entry = await l2_get(key)
+    if l2_entry:
+        data, stored_at = l2_entry
+        cache.set(key, data, stored_at)
+        if time.time() - stored_at < cache.ttl_for(key):
             return data
+    stale = cache.get_stale(key)
+    if stale:
+        start_flight(key, fetch)
+        return stale
     return None
 
-def set_cache(key: str, data: Any):
-    """Set cache with timestamp"""
-    cache[key] = (data, datetime.now().timestamp())
+# Results derived from cached snapshots (parsed leagues, merged match lists),
+# keyed on the versions of the snapshots they were built from
+DERIVED_CACHE_MAX = 256
+derived_cache: "OrderedDict[Any, Tuple[Any, Any]]" = OrderedDict()
+
+def snapshot_version(key: str, data: Any) -> Optional[int]:
+    """Version of the cached snapshot a fetcher returned; 0 for an empty result.
+    
+    None means the data can't be tied to a cache entry (e.g. it was just replaced),
+    so nothing derived from it should be cached."""
+    if not data:
+        return 0
+    return cache.version(key, data)
+
+def get_derived(key: Any, version: Any) -> Optional[Any]:
+    entry = derived_cache.get(key)
+    if entry is None or entry[0] != version:
+        return None
+    derived_cache.move_to_end(key)
+    return entry[1]
+
+def set_derived(key: Any, version: Any, value: Any):
+    if version is None:
+        return
+    derived_cache[key] = (version, value)
+    derived_cache.move_to_end(key)
+    while len(derived_cache) > DERIVED_CACHE_MAX:
+        derived_cache.popitem(last=False)
+
+# Pre-serialized JSON responses with ETags and negotiated compression
+COMPRESS_MIN_BYTES = 1024
+
+def dumps_json(data: Any) -> bytes:
+    """Serialize to compact JSON bytes (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+class SerializedPayload:
+    """A response body serialized once, with its strong ETag and lazily compressed variants"""
+    __slots__ = ("body", "digest", "_encoded")
+
+    def __init__(self, data: Any):
+        self.body = dumps_json(data)
+        self.digest = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        self._encoded: Dict[str, bytes] = {}
+
+    def etag(self, encoding: Optional[str]) -> str:
+        # Each content-coding is its own representation, so it gets its own strong ETag
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if not encoding:
+            return self.body
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+        return self._encoded[encoding]
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=lambda name: accepted.get(name, wildcard))
+    return best if accepted.get(best, wildcard) > 0 else None
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def serialized_response(request: Request, payload: SerializedPayload) -> Response:
+    """Send pre-serialized JSON, or 304 when the client already has this representation"""
+    encoding = None
+    if len(payload.body) >= COMPRESS_MIN_BYTES:
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    etag = payload.etag(encoding)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=payload.encoded(encoding), media_type="application/json", headers=headers)
+
+def get_serialized(derived_key: Any, version: Any, payload: Any) -> SerializedPayload:
+    """Serialized form of a derived result, built once per snapshot version"""
+    serialized = get_derived(("json", derived_key), version)
+    if serialized is None:
+        serialized = SerializedPayload(payload)
+        set_derived(("json", derived_key), version, serialized)
+    return serialized
+
+async def timed(timings: Optional[Dict[str, float]], stage: str, awaitable: Awaitable[Any]) -> Any:
+    """Await something and record how long it took (ms) under timings[stage]"""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        if timings is not None:
+            timings[stage] = round((time.perf_counter() - start) * 1000, 1)
 
 async def fetch_football_data(endpoint: str, use_cache: bool = True) -> Dict[str, Any]:
     """Fetch data from Football-Data.org API"""
@@ -123,33 +645,40 @@ async def fetch_football_data(endpoint: str, use_cache: bool = True) -> Dict[str
         return {}
     
     cache_key = f"fd:{endpoint}"
+    fetch = lambda: _fetch_football_data_upstream(endpoint, cache_key)
     if use_cache:
-        cached = get_cache(cache_key)
+        cached = await read_through(cache_key, fetch)
         if cached:
             return cached
     
+    return await single_flight(cache_key, fetch)
+
+async def _fetch_football_data_upstream(endpoint: str, cache_key: str) -> Dict[str, Any]:
     headers = {
         "X-Auth-Token": FOOTBALL_DATA_KEY,
     }
     
-    async with httpx.AsyncClient() as http_client:
-        try:
-            url = f"{FOOTBALL_DATA_BASE}{endpoint}"
-            logger.info(f"Fetching: {url}")
+    http_client = get_http_client("football_data")
+    try:
+        url = f"{FOOTBALL_DATA_BASE}{endpoint}"
+        logger.info(f"Fetching: {url}")
+        async with provider_budgets["football_data"].slot():
             response = await http_client.get(url, headers=headers, timeout=30.0)
-            if response.status_code == 200:
-                data = response.json()
-                set_cache(cache_key, data)
-                return data
-            elif response.status_code == 429:
-                logger.warning("Rate limited, waiting...")
-                await asyncio.sleep(60)
-                return {}
-            logger.error(f"Football-Data.org error: {response.status_code} - {response.text[:200]}")
-            return {}
-        except Exception as e:
-            logger.error(f"Football-Data.org exception: {e}")
+        if response.status_code == 200:
+            data = response.json()
+            set_cache(cache_key, data)
+            return data
+        elif response.status_code == 429:
+            # Pause this provider until its request counter resets instead of holding the request
+            reset = int(response.headers.get("X-RequestCounter-Reset", "60") or 60)
+            logger.warning(f"Rate limited, pausing Football-Data.org for {reset}s")
+            provider_budgets["football_data"].backoff(reset)
             return {}
+        logger.error(f"Football-Data.org error: {response.status_code} - {response.text[:200]}")
+        return {}
+    except Exception as e:
+        logger.error(f"Football-Data.org exception: {e}")
+        return {}
 
 async def fetch_api_basketball(endpoint: str, use_cache: bool = True) -> Dict[str, Any]:
     """Fetch data from API-Basketball"""
@@ -157,27 +686,676 @@ async def fetch_api_basketball(endpoint: str, use_cache: bool = True) -> Dict[st
         return {}
     
     cache_key = f"basketball:{endpoint}"
+    fetch = lambda: _fetch_api_basketball_upstream(endpoint, cache_key)
     if use_cache:
-        cached = get_cache(cache_key)
+        cached = await read_through(cache_key, fetch)
         if cached:
             return cached
     
+    return await single_flight(cache_key, fetch)
+
+async def _fetch_api_basketball_upstream(endpoint: str, cache_key: str) -> Dict[str, Any]:
     headers = {
         "x-apisports-key": API_FOOTBALL_KEY,
     }
     
-    async with httpx.AsyncClient() as http_client:
-        try:
-            url = f"{API_BASKETBALL_BASE}{endpoint}"
+    http_client = get_http_client("api_basketball")
+    try:
+        url = f"{API_BASKETBALL_BASE}{endpoint}"
+        async with provider_budgets["api_basketball"].slot():
             response = await http_client.get(url, headers=headers, timeout=30.0)
-            if response.status_code == 200:
-                data = response.json()
-                set_cache(cache_key, data)
-                return data
-            return {}
-        except Exception as e:
-            logger.error(f"API-Basketball exception: {e}")
-            return {}
+        if response.status_code == 200:
+            data = response.json()
+            set_cache(cache_key, data)
+            return data
+        return {}
+    except Exception as e:
+        logger.error(f"API-Basketball exception: {e}")
+        return {}
+
+# Odds aggregation - every (event, bookmaker, market, outcome, point, price) row of an
+# Odds API payload is flattened into NumPy arrays and reduced per outcome in one pass
+FOOTBALL_ODDS_MARKETS = ("Match Winner", "Over/Under 2.5", "Over/Under Alternative", "Handicap", "Both Teams Score")
+BASKETBALL_ODDS_MARKETS = ("Match Winner", "Over/Under")
+
+def football_outcome_labels(market_key: str, name: str, point: Optional[float],
+                            home_team: str, away_team: str) -> List[Tuple[str, str]]:
+    """The (market, selection) groups a football outcome price counts towards"""
+    if market_key == "h2h":
+        if name == home_team:
+            return [("Match Winner", "Home")]
+        if name == away_team:
+            return [("Match Winner", "Away")]
+        if name == "Draw":
+            return [("Match Winner", "Draw")]
+    elif market_key == "totals":
+        point = 2.5 if point is None else point
+        # Every line is listed under the alternatives; 2.5 is also the main line
+        labels = [("Over/Under Alternative", f"{name} {point}")]
+        if point == 2.5 and name in ("Over", "Under"):
+            labels.insert(0, ("Over/Under 2.5", name))
+        return labels
+    elif market_key == "spreads":
+        point = 0 if point is None else point
+        side = "Home" if name == home_team else "Away" if name == away_team else None
+        if side:
+            return [("Handicap", f"{side} ({'+' if point > 0 else ''}{point})")]
+    elif market_key == "btts":
+        if name in ("Yes", "No"):
+            return [("Both Teams Score", name)]
+    return []
+
+def basketball_outcome_labels(market_key: str, name: str, point: Optional[float],
+                              home_team: str, away_team: str) -> List[Tuple[str, str]]:
+    """The (market, selection) groups a basketball outcome price counts towards"""
+    if market_key == "h2h":
+        if name == home_team:
+            return [("Match Winner", "Home")]
+        if name == away_team:
+            return [("Match Winner", "Away")]
+    elif market_key == "totals" and name in ("Over", "Under"):
+        return [("Over/Under", f"{name} {0 if point is None else point}")]
+    return []
+
+class OddsRows:
+    """Columnar (event, bookmaker, market, selection, price) rows of one Odds API payload"""
+    __slots__ = ("groups", "books", "prices", "group_keys", "book_names", "event_bookmakers")
+
+    def __init__(self, groups: np.ndarray, books: np.ndarray, prices: np.ndarray,
+                 group_keys: List[Tuple[int, str, str]], book_names: List[str], event_bookmakers: List[List[str]]):
+        self.groups = groups  # index into group_keys: (event index, market, selection)
+        self.books = books  # index into book_names
+        self.prices = prices
+        self.group_keys = group_keys
+        self.book_names = book_names
+        self.event_bookmakers = event_bookmakers
+
+def flatten_odds(events: List[Dict[str, Any]], outcome_labels: Callable[..., List[Tuple[str, str]]]) -> OddsRows:
+    """Flatten every outcome price of an Odds API payload into rows, in one pass"""
+    group_ids: Dict[Tuple[int, str, str], int] = {}
+    book_ids: Dict[str, int] = {}
+    row_groups: List[int] = []
+    row_books: List[int] = []
+    row_prices: List[float] = []
+    event_bookmakers: List[List[str]] = []
+    
+    for event_index, event in enumerate(events):
+        home_team, away_team = event.get("home_team"), event.get("away_team")
+        titles: List[str] = []
+        for bookmaker in event.get("bookmakers", []):
+            title = bookmaker.get("title", "")
+            if title not in titles:
+                titles.append(title)
+            book = book_ids.setdefault(title, len(book_ids))
+            for market in bookmaker.get("markets", []):
+                market_key = market.get("key", "")
+                for outcome in market.get("outcomes", []):
+                    price = outcome.get("price")
+                    if not isinstance(price, (int, float)) or price <= 1:
+                        continue
+                    for market_name, selection in outcome_labels(market_key, outcome.get("name", ""),
+                                                                 outcome.get("point"), home_team, away_team):
+                        row_groups.append(group_ids.setdefault((event_index, market_name, selection), len(group_ids)))
+                        row_books.append(book)
+                        row_prices.append(price)
+        event_bookmakers.append(titles)
+    
+    return OddsRows(np.asarray(row_groups, dtype=np.int64), np.asarray(row_books, dtype=np.int64),
+                    np.asarray(row_prices, dtype=np.float64), list(group_ids), list(book_ids), event_bookmakers)
+
+def aggregate_odds(rows: OddsRows) -> List[Dict[str, Dict[str, Dict[str, Any]]]]:
+    """Per event: market -> selection -> stats.
+    
+    Stats are the best, mean and median price, the number of prices and the
+    bookmaker offering the best one. Selections keep first-seen order."""
+    results: List[Dict[str, Dict[str, Dict[str, Any]]]] = [{} for _ in rows.event_bookmakers]
+    if not len(rows.prices):
+        return results
+    
+    # Sort by group, then price, so each group is a contiguous ascending run
+    order = np.lexsort((rows.prices, rows.groups))
+    groups, prices, books = rows.groups[order], rows.prices[order], rows.books[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(groups)])
+    ends = starts + counts - 1
+    
+    best = prices[ends]
+    mean = np.add.reduceat(prices, starts) / counts
+    median = (prices[starts + (counts - 1) // 2] + prices[starts + counts // 2]) / 2
+    
+    for group, best_price, mean_price, median_price, count, book in zip(
+            groups[starts].tolist(), best.tolist(), np.round(mean, 3).tolist(),
+            np.round(median, 3).tolist(), counts.tolist(), books[ends].tolist()):
+        event_index, market_name, selection = rows.group_keys[group]
+        results[event_index].setdefault(market_name, {})[selection] = {
+            "best": best_price,
+            "mean": mean_price,
+            "median": median_price,
+            "count": count,
+            "best_bookmaker": rows.book_names[book],
+        }
+    return results
+
+# Consensus probabilities - each book's prices for a market have the margin removed,
+# then books are averaged per event, weighted towards the lowest-margin (sharpest) books
+ODDS_MARGIN_METHOD = os.environ.get('ODDS_MARGIN_METHOD', 'shin')  # multiplicative, shin or power
+ODDS_CONSENSUS_WEIGHTING = os.environ.get('ODDS_CONSENSUS_WEIGHTING', 'margin')  # margin or equal
+MARGIN_SOLVER_ITERATIONS = 40
+FOOTBALL_CONSENSUS_MARKETS = {
+    "Match Winner": ("Home", "Draw", "Away"),
+    "Over/Under 2.5": ("Over", "Under"),
+    "Both Teams Score": ("Yes", "No"),
+}
+BASKETBALL_CONSENSUS_MARKETS = {"Match Winner": ("Home", "Away")}
+
+def total_line_label(selection: str) -> Optional[Tuple[str, str, Tuple[str, ...]]]:
+    """("Over 1.5") -> ("Over/Under 1.5", "Over", both sides)"""
+    side, _, line = selection.partition(" ")
+    if side not in ("Over", "Under") or not line:
+        return None
+    return f"Over/Under {line}", side, ("Over", "Under")
+
+def handicap_line_label(selection: str) -> Optional[Tuple[str, str, Tuple[str, ...]]]:
+    """("Away (+0.5)") -> ("Handicap -0.5", "Away", both sides); lines are named from the home side"""
+    found = re.fullmatch(r"(Home|Away) \(([+-]?[\d.]+)\)", selection)
+    if not found:
+        return None
+    point = float(found.group(2))
+    home_point = (point if found.group(1) == "Home" else -point) + 0.0  # no "-0"
+    return f"Handicap {'+' if home_point > 0 else ''}{home_point:g}", found.group(1), ("Home", "Away")
+
+def football_consensus_label(market: str, selection: str) -> Optional[Tuple[str, str, Tuple[str, ...]]]:
+    """The consensus market a priced football selection belongs to: (market, selection, all its selections)"""
+    if market in FOOTBALL_CONSENSUS_MARKETS:
+        selections = FOOTBALL_CONSENSUS_MARKETS[market]
+        return (market, selection, selections) if selection in selections else None
+    if market == "Over/Under Alternative" and not selection.endswith(" 2.5"):  # 2.5 is the main line
+        return total_line_label(selection)
+    if market == "Handicap":
+        return handicap_line_label(selection)
+    return None
+
+def basketball_consensus_label(market: str, selection: str) -> Optional[Tuple[str, str, Tuple[str, ...]]]:
+    """The consensus market a priced basketball selection belongs to: (market, selection, all its selections)"""
+    if market in BASKETBALL_CONSENSUS_MARKETS:
+        selections = BASKETBALL_CONSENSUS_MARKETS[market]
+        return (market, selection, selections) if selection in selections else None
+    if market == "Over/Under":
+        return total_line_label(selection)
+    return None
+
+def shin_probabilities(implied: np.ndarray, total: np.ndarray, z: np.ndarray) -> np.ndarray:
+    return (np.sqrt(z ** 2 + 4 * (1 - z) * implied ** 2 / total) - z) / (2 * (1 - z))
+
+def remove_margin(implied: np.ndarray, method: str = ODDS_MARGIN_METHOD) -> np.ndarray:
+    """Fair probabilities from implied ones (1 / price); one row per book and market.
+    
+    multiplicative scales each row to sum to 1. power solves sum(q ** k) = 1 per
+    row (Newton). shin solves for the insider-trading share z per row (bisection)."""
+    total = implied.sum(axis=1, keepdims=True)
+    if method == "power":
+        k = np.ones_like(total)
+        logs = np.log(implied)
+        for _ in range(MARGIN_SOLVER_ITERATIONS):
+            powered = implied ** k
+            k = k - (powered.sum(axis=1, keepdims=True) - 1) / (powered * logs).sum(axis=1, keepdims=True)
+        fair = implied ** k
+    elif method == "shin":
+        # The probabilities sum to sqrt(total) at z = 0 and shrink as z grows
+        low, high = np.zeros_like(total), np.full_like(total, 0.5)
+        for _ in range(MARGIN_SOLVER_ITERATIONS):
+            z = (low + high) / 2
+            over = shin_probabilities(implied, total, z).sum(axis=1, keepdims=True) > 1
+            low, high = np.where(over, z, low), np.where(over, high, z)
+        fair = shin_probabilities(implied, total, (low + high) / 2)
+    else:
+        fair = implied
+    return fair / fair.sum(axis=1, keepdims=True)
+
+def consensus_probabilities(rows: OddsRows, consensus_label: Callable[[str, str], Optional[Tuple[str, str, Tuple[str, ...]]]],
+                            method: str = ODDS_MARGIN_METHOD) -> List[Dict[str, Dict[str, Any]]]:
+    """Per event: consensus market -> margin-free probabilities, books used and their mean margin.
+    
+    Every line of a line market (totals, handicaps) is its own consensus market;
+    "market" and "selections" point back at the priced market and selection names.
+    Only books quoting every selection of a market count towards it."""
+    n_events = len(rows.event_bookmakers)
+    results: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(n_events)]
+    if not len(rows.prices):
+        return results
+    n_books = len(rows.book_names)
+    group_events = np.fromiter((key[0] for key in rows.group_keys), dtype=np.int64, count=len(rows.group_keys))
+    
+    # Consensus market id and selection column of every (event, market, selection) group
+    consensus_markets: Dict[str, Tuple[int, Tuple[str, ...], str, Dict[str, str]]] = {}
+    group_markets = np.full(len(rows.group_keys), -1, dtype=np.int64)
+    group_columns = np.zeros(len(rows.group_keys), dtype=np.int64)
+    for group, (_, market, selection) in enumerate(rows.group_keys):
+        label = consensus_label(market, selection)
+        if not label:
+            continue
+        consensus_market, consensus_selection, selections = label
+        if consensus_market not in consensus_markets:
+            consensus_markets[consensus_market] = (len(consensus_markets), selections, market, {})
+        market_id, _, _, priced_selections = consensus_markets[consensus_market]
+        priced_selections.setdefault(consensus_selection, selection)
+        group_markets[group] = market_id
+        group_columns[group] = selections.index(consensus_selection)
+    row_markets = group_markets[rows.groups]
+    row_columns = group_columns[rows.groups]
+    
+    for market_name, (market_id, selections, priced_market, priced_selections) in consensus_markets.items():
+        mask = row_markets == market_id
+        
+        # One matrix row per (event, book) quoting this market, one column per selection
+        pairs, pair_rows = np.unique(group_events[rows.groups[mask]] * n_books + rows.books[mask], return_inverse=True)
+        prices = np.full((len(pairs), len(selections)), np.nan)
+        prices[pair_rows, row_columns[mask]] = rows.prices[mask]
+        complete = ~np.isnan(prices).any(axis=1)
+        if not complete.any():
+            continue
+        prices, pair_events = prices[complete], pairs[complete] // n_books
+        
+        implied = 1 / prices
+        margins = implied.sum(axis=1) - 1
+        fair = remove_margin(implied, method)
+        weights = 1 / np.maximum(margins, 0.005) if ODDS_CONSENSUS_WEIGHTING == "margin" else np.ones(len(margins))
+        
+        weight_sums = np.bincount(pair_events, weights=weights, minlength=n_events)
+        books = np.bincount(pair_events, minlength=n_events)
+        mean_margins = np.bincount(pair_events, weights=margins, minlength=n_events) / np.maximum(books, 1)
+        probabilities = np.stack([
+            np.bincount(pair_events, weights=weights * fair[:, column], minlength=n_events)
+            for column in range(len(selections))
+        ], axis=1) / np.maximum(weight_sums, 1e-12)[:, None]
+        
+        for event_index in np.flatnonzero(books).tolist():
+            results[event_index][market_name] = {
+                "probabilities": dict(zip(selections, np.round(probabilities[event_index], 4).tolist())),
+                "books": int(books[event_index]),
+                "margin": round(float(mean_margins[event_index]), 4),
+                "market": priced_market,
+                "selections": priced_selections,
+            }
+    return results
+
+def best_price_odds(market_stats: Dict[str, Dict[str, Dict[str, Any]]], markets: Tuple[str, ...]) -> Dict[str, Dict[str, float]]:
+    """Best price per selection for each market"""
+    odds: Dict[str, Dict[str, float]] = {market: {} for market in markets}
+    for market, selections in market_stats.items():
+        odds[market] = {selection: stats["best"] for selection, stats in selections.items()}
+    return odds
+
+# Prices stay floats internally (cached snapshots, quick analysis, value bets) and are
+# only formatted as strings where matches leave the API
+PRICE_MARKETS = frozenset(FOOTBALL_ODDS_MARKETS + BASKETBALL_ODDS_MARKETS)
+
+def format_odds(odds: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """API form of an odds dict: best prices as 2-decimal strings"""
+    if not odds:
+        return odds
+    return {
+        key: {selection: str(round(price, 2)) for selection, price in value.items()} if key in PRICE_MARKETS else value
+        for key, value in odds.items()
+    }
+
+def parse_odds(odds: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Internal form of client-supplied odds: prices as floats, unparseable ones dropped"""
+    if not odds or not isinstance(odds, dict):
+        return odds
+    parsed: Dict[str, Any] = {}
+    for key, value in odds.items():
+        if key in PRICE_MARKETS and isinstance(value, dict):
+            prices = {}
+            for selection, price in value.items():
+                try:
+                    prices[selection] = float(price)
+                except (TypeError, ValueError):
+                    continue
+            value = prices
+        parsed[key] = value
+    return parsed
+
+# Parlay simulation - legs are priced from margin-free consensus probabilities and each
+# match is simulated as one joint outcome, so legs on the same match stay correlated
+# (Home Win and Over 2.5 win together more often than their product suggests)
+# Each match costs about 20 ms per million trials; 250k keeps the standard error under 0.1 points
+PARLAY_SIMULATIONS = int(os.environ.get('PARLAY_SIMULATIONS', '250000'))
+PARLAY_MAX_SIMULATIONS = 5_000_000
+PARLAY_SIMULATION_CHUNK = 250_000
+SIMULATION_RESOLUTION = 1 << 20  # uniform draws are quantized to steps of 2 ** -20
+GOAL_RATES = np.round(np.arange(0.2, 4.0001, 0.05), 2)  # expected goals grid for the goal model
+MAX_GOALS = 10
+
+# A football match outcome as one of 12 cells: result x total goals vs 2.5 x both teams scoring
+MATCH_CELLS = [(result, total, btts) for result in ("home", "draw", "away")
+               for total in ("over", "under") for btts in ("yes", "no")]
+LEG_OUTCOMES = {
+    "home": (0, "home"), "draw": (0, "draw"), "away": (0, "away"),
+    "over_2.5": (1, "over"), "under_2.5": (1, "under"),
+    "btts_yes": (2, "yes"), "btts_no": (2, "no"),
+}
+LEG_OUTCOME_MASKS = {
+    outcome: np.array([cell[dimension] == value for cell in MATCH_CELLS])
+    for outcome, (dimension, value) in LEG_OUTCOMES.items()
+}
+goal_model_cells: Optional[np.ndarray] = None
+
+def goal_model_table() -> np.ndarray:
+    """Cell probabilities of independent Poisson home/away goals for every pair of
+    rates in GOAL_RATES; shape (len(GOAL_RATES) ** 2, 12). Built once on first use."""
+    global goal_model_cells
+    if goal_model_cells is None:
+        goals = np.arange(MAX_GOALS + 1)
+        factorials = np.array([math.factorial(g) for g in goals], dtype=np.float64)
+        pmf = np.exp(-GOAL_RATES[:, None]) * GOAL_RATES[:, None] ** goals / factorials
+        joint = pmf[:, None, :, None] * pmf[None, :, None, :]  # (home rate, away rate, home goals, away goals)
+        home_goals, away_goals = goals[:, None], goals[None, :]
+        score_cells = {
+            "home": home_goals > away_goals, "draw": home_goals == away_goals, "away": home_goals < away_goals,
+            "over": home_goals + away_goals > 2.5, "under": home_goals + away_goals < 2.5,
+            "yes": (home_goals > 0) & (away_goals > 0), "no": (home_goals == 0) | (away_goals == 0),
+        }
+        cells = np.stack([
+            joint[..., score_cells[result] & score_cells[total] & score_cells[btts]].sum(axis=-1)
+            for result, total, btts in MATCH_CELLS
+        ], axis=-1).reshape(-1, len(MATCH_CELLS))
+        goal_model_cells = cells / cells.sum(axis=1, keepdims=True)
+    return goal_model_cells
+
+def fit_goal_model(targets: Dict[str, float]) -> np.ndarray:
+    """Cell probabilities of the goal-rate pair that best reproduces the target
+    leg probabilities (least squares over the rate grid)"""
+    cells = goal_model_table()
+    error = np.zeros(len(cells))
+    for outcome, probability in targets.items():
+        error += (cells[:, LEG_OUTCOME_MASKS[outcome]].sum(axis=1) - probability) ** 2
+    return cells[int(np.argmin(error))]
+
+def independent_match_cells(marginals: Dict[str, float]) -> np.ndarray:
+    """Cell probabilities treating result, total and both-teams-score as independent"""
+    dimensions = [{}, {}, {}]
+    for outcome, probability in marginals.items():
+        dimension, value = LEG_OUTCOMES[outcome]
+        dimensions[dimension][value] = probability
+    # Values nobody priced share whatever probability the priced ones leave
+    for known, values in zip(dimensions, (("home", "draw", "away"), ("over", "under"), ("yes", "no"))):
+        unknown = [value for value in values if value not in known]
+        remainder = max(0.0, 1 - sum(known.values()))
+        for value in unknown:
+            known[value] = remainder / len(unknown)
+    cells = np.array([
+        dimensions[0][result] * dimensions[1][total] * dimensions[2][btts]
+        for result, total, btts in MATCH_CELLS
+    ])
+    return cells / cells.sum() if cells.sum() > 0 else np.full(len(MATCH_CELLS), 1 / len(MATCH_CELLS))
+
+def quantized_counts(probabilities: np.ndarray, total: int) -> np.ndarray:
+    """Integer counts summing to total, proportional to probabilities (largest remainder)"""
+    scaled = probabilities / probabilities.sum() * total
+    counts = np.floor(scaled).astype(np.int64)
+    counts[np.argsort(counts - scaled)[:total - counts.sum()]] += 1
+    return counts
+
+def simulate_parlay(match_cells: List[np.ndarray], modeled_legs: List[Tuple[int, str]],
+                    independent_legs: List[float], trials: int, seed: Optional[int] = None) -> np.ndarray:
+    """Monte Carlo over whole matches; returns how many trials won 0..n legs.
+    
+    modeled_legs are (match index, outcome) against match_cells; independent_legs
+    are bare win probabilities for legs no match model covers. Each match takes one
+    uniform draw per trial, shared by all of its legs; draws are quantized to
+    SIMULATION_RESOLUTION so a draw maps to that match's legs won by table lookup."""
+    rng = np.random.default_rng(seed)
+    n_legs = len(modeled_legs) + len(independent_legs)
+    
+    legs_won_tables = []
+    for match_index, cells in enumerate(match_cells):
+        legs_per_cell = np.zeros(len(MATCH_CELLS), dtype=np.int16)
+        for leg_match, outcome in modeled_legs:
+            if leg_match == match_index:
+                legs_per_cell += LEG_OUTCOME_MASKS[outcome]
+        if legs_per_cell.any():
+            legs_won_tables.append(np.repeat(legs_per_cell, quantized_counts(cells, SIMULATION_RESOLUTION)))
+    thresholds = [round(probability * SIMULATION_RESOLUTION) for probability in independent_legs]
+    
+    histogram = np.zeros(n_legs + 1, dtype=np.int64)
+    for start in range(0, trials, PARLAY_SIMULATION_CHUNK):
+        size = min(PARLAY_SIMULATION_CHUNK, trials - start)
+        won = np.zeros(size, dtype=np.int16)
+        for table in legs_won_tables:
+            won += table[rng.integers(0, SIMULATION_RESOLUTION, size, dtype=np.uint32)]
+        for threshold in thresholds:
+            won += rng.integers(0, SIMULATION_RESOLUTION, size, dtype=np.uint32) < threshold
+        histogram += np.bincount(won, minlength=n_legs + 1)
+    return histogram
+
+# Odds snapshots - every refreshed odds snapshot is diffed against the last recorded one
+# for its sport key, per (event, market, selection, bookmaker). The diff feeds both the
+# odds history store and the change feed below. Snapshots are recorded by a single worker
+# (see the odds recorder), against the last recorded prices kept in MongoDB.
+# Last recorded prices per sport key: event id -> (market, selection, bookmaker) -> price.
+# Replaced on every recording, so events dropped from the feed are dropped here too.
+odds_last_prices: Dict[str, Dict[str, Dict[Tuple[str, str, str], float]]] = {}
+odds_recorded_at: Dict[str, float] = {}  # stored_at of the last recorded snapshot per sport key
+
+def odds_snapshot_prices(events: List[Dict[str, Any]], rows: OddsRows) -> Dict[str, Dict[Tuple[str, str, str], float]]:
+    """Event id -> (market, selection, bookmaker) -> price for one flattened payload"""
+    prices: List[Dict[Tuple[str, str, str], float]] = [{} for _ in events]
+    for group, book, price in zip(rows.groups.tolist(), rows.books.tolist(), rows.prices.tolist()):
+        event_index, market_name, selection = rows.group_keys[group]
+        prices[event_index][(market_name, selection, rows.book_names[book])] = price
+    return {event.get("id"): event_prices for event, event_prices in zip(events, prices) if event.get("id")}
+
+def diff_odds_prices(previous: Dict[Tuple[str, str, str], float],
+                     current: Dict[Tuple[str, str, str], float]) -> List[List[Any]]:
+    """[market, selection, bookmaker, price] for every price that changed; price is None when withdrawn"""
+    changes = [[*key, price] for key, price in current.items() if previous.get(key) != price]
+    changes += [[*key, None] for key in previous if key not in current]
+    return changes
+
+async def load_recorded_prices(sport_key: str):
+    """Pick up the last recorded prices for a sport key, e.g. after taking over as recorder"""
+    doc = await db.odds_snapshots.find_one({"_id": sport_key})
+    prices = json.loads(doc["prices"]) if doc else {}
+    odds_last_prices[sport_key] = {
+        event_id: {(market_name, selection, bookmaker): price for market_name, selection, bookmaker, price in rows}
+        for event_id, rows in prices.items()
+    }
+    odds_recorded_at[sport_key] = doc["stored_at"] if doc else 0.0
+
+async def record_odds_snapshot(sport_key: str, stored_at: float, events: List[Dict[str, Any]], rows: OddsRows):
+    """Diff a snapshot against the last recorded one for its sport key and record the changes"""
+    current = odds_snapshot_prices(events, rows)
+    previous = odds_last_prices.get(sport_key, {})
+    
+    diffs: Dict[str, List[List[Any]]] = {}
+    for event_id, prices in current.items():
+        changes = diff_odds_prices(previous.get(event_id, {}), prices)
+        if changes or event_id not in previous:
+            diffs[event_id] = changes
+    removed = [event_id for event_id in previous if event_id not in current]
+    
+    await record_odds_history(sport_key, stored_at, events, diffs, previous)
+    await append_odds_changes(sport_key, stored_at, diffs, removed, previous, current)
+    # Stored as a JSON string: market names like "Over/Under 2.5" aren't valid field names
+    await db.odds_snapshots.replace_one(
+        {"_id": sport_key},
+        {"_id": sport_key, "stored_at": stored_at, "prices": json.dumps({
+            event_id: [[*key, price] for key, price in prices.items()] for event_id, prices in current.items()
+        })},
+        upsert=True,
+    )
+    odds_last_prices[sport_key] = current
+    odds_recorded_at[sport_key] = stored_at
+
+# Odds history - the changed (market, selection, bookmaker) prices of every refresh are
+# appended to per-event bucket documents in MongoDB. A bucket closes after a fixed
+# number of samples/rows, and buckets expire after the retention period, so no
+# document grows without bound.
+ODDS_HISTORY = os.environ.get('ODDS_HISTORY', 'true').lower() == 'true'
+ODDS_HISTORY_RETENTION_DAYS = int(os.environ.get('ODDS_HISTORY_RETENTION_DAYS', '180'))
+ODDS_HISTORY_BUCKET_SAMPLES = 288  # a day of 5-minute refreshes
+ODDS_HISTORY_BUCKET_ROWS = 5000  # price changes per bucket (a full sample is ~20 books x ~30 prices)
+odds_history_stats = {"samples": 0, "changes": 0, "writes": 0, "errors": 0}
+
+async def record_odds_history(sport_key: str, now: float, events: List[Dict[str, Any]],
+                              diffs: Dict[str, List[List[Any]]], previous: Dict[str, Any]):
+    """Append one sample per changed event"""
+    if not ODDS_HISTORY or not diffs:
+        return
+    expires_at = datetime.fromtimestamp(now + ODDS_HISTORY_RETENTION_DAYS * 86400, timezone.utc)
+    # A pass retried after a later step failed records the same snapshot again; its samples are already stored
+    recorded = set(await db.odds_history.distinct("event_id", {"event_id": {"$in": list(diffs)}, "samples.t": now}))
+    operations = []
+    for event in events:
+        event_id = event.get("id")
+        if event_id not in diffs or event_id in recorded:
+            continue
+        # The first recorded sample of an event is a full snapshot: readers reset to it
+        full = event_id not in previous
+        changes = diffs[event_id]
+        odds_history_stats["samples"] += 1
+        odds_history_stats["changes"] += len(changes)
+        operations.append(UpdateOne(
+            {"event_id": event_id, "n": {"$lt": ODDS_HISTORY_BUCKET_SAMPLES}, "rows": {"$lt": ODDS_HISTORY_BUCKET_ROWS}},
+            {
+                "$push": {"samples": {"t": now, "full": full, "c": changes}},
+                "$inc": {"n": 1, "rows": len(changes)},
+                "$min": {"start": now},
+                "$max": {"end": now, "expires_at": expires_at},
+                "$setOnInsert": {
+                    "sport_key": sport_key,
+                    "home_team": event.get("home_team"),
+                    "away_team": event.get("away_team"),
+                    "commence_time": event.get("commence_time"),
+                    "kickoff": parse_kickoff(event.get("commence_time")),
+                },
+            },
+            upsert=True,
+        ))
+    if not operations:
+        return
+    try:
+        await db.odds_history.bulk_write(operations, ordered=False)
+        odds_history_stats["writes"] += len(operations)
+    except Exception:
+        odds_history_stats["errors"] += 1
+        raise
+
+def replay_odds_history(buckets: List[Dict[str, Any]], markets: Optional[set] = None,
+                        bookmakers: Optional[set] = None) -> Dict[Tuple[str, str, str], Tuple[List[float], List[float]]]:
+    """(market, selection, bookmaker) -> (times, prices) step series; withdrawn prices are NaN"""
+    series: Dict[Tuple[str, str, str], Tuple[List[float], List[float]]] = {}
+    live: set = set()
+    # Buckets may overlap in time (e.g. around a recorder handover), so samples are replayed in time order
+    samples = sorted((sample for bucket in buckets for sample in bucket.get("samples", [])), key=lambda sample: sample["t"])
+    for sample in samples:
+        t = sample["t"]
+        changed = set()
+        for market_name, selection, bookmaker, price in sample["c"]:
+            if (markets and market_name not in markets) or (bookmakers and bookmaker not in bookmakers):
+                continue
+            key = (market_name, selection, bookmaker)
+            times, prices = series.setdefault(key, ([], []))
+            times.append(t)
+            prices.append(math.nan if price is None else price)
+            changed.add(key)
+            if price is None:
+                live.discard(key)
+            else:
+                live.add(key)
+        if sample.get("full"):
+            # Anything not in a full snapshot was withdrawn while nothing was recording
+            for key in live - changed:
+                series[key][0].append(t)
+                series[key][1].append(math.nan)
+            live &= changed
+    return series
+
+def downsample_series(times: List[float], prices: List[float], grid: np.ndarray) -> List[List[Any]]:
+    """[[iso time, price], ...] for a step series, sampled at the grid times once it has more points than the grid"""
+    t, p = np.asarray(times), np.asarray(prices)
+    if len(t) > len(grid):
+        positions = np.searchsorted(t, grid, side="right") - 1
+        valid = positions >= 0
+        t, p = grid[valid], p[positions[valid]]
+        # Consecutive grid points at the same price add nothing to a step series
+        keep = np.r_[True, (p[1:] != p[:-1]) & ~(np.isnan(p[1:]) & np.isnan(p[:-1]))]
+        keep[-1] = True
+        t, p = t[keep], p[keep]
+    return [
+        [datetime.fromtimestamp(ts, timezone.utc).isoformat(), None if math.isnan(price) else price]
+        for ts, price in zip(t.tolist(), p.tolist())
+    ]
+
+# Odds change feed - every price change gets the next version number, so clients poll
+# GET /api/odds/changes?since=<version> and apply the deltas instead of re-downloading
+# match lists. Changes are written by the odds recorder (a single worker) as one batch
+# document per recorded snapshot, numbered consecutively from the version in odds_feed,
+# so every worker serves the same feed. The stream id only changes if the feed is
+# wiped; together with "reset" it tells clients when to reload in full.
+ODDS_CHANGE_FEED = os.environ.get('ODDS_CHANGE_FEED', 'true').lower() == 'true'
+ODDS_CHANGE_RETENTION_HOURS = int(os.environ.get('ODDS_CHANGE_RETENTION_HOURS', '48'))
+odds_change_stats = {"batches": 0, "changes": 0}
+
+async def repair_odds_feed_head():
+    """Move the head past batches stored by a writer that stopped before moving it.
+    
+    Their changes become visible; the retried recording repeats them with the
+    same absolute prices, so clients applying both end up in the same state."""
+    last = await db.odds_changes.find_one({}, {"end": 1}, sort=[("_id", -1)])
+    if last:
+        await db.odds_feed.update_one({"_id": "odds"}, {"$max": {"version": last["end"]}})
+
+async def append_odds_changes(sport_key: str, now: float, diffs: Dict[str, List[List[Any]]], removed: List[str],
+                              previous: Dict[str, Dict[Tuple[str, str, str], float]],
+                              current: Dict[str, Dict[Tuple[str, str, str], float]]):
+    """Append one batch of [event id, market, selection, bookmaker, price, previous price, best price] rows;
+    a row with no market means the event left the odds feed"""
+    if not ODDS_CHANGE_FEED:
+        return
+    rows = []
+    for event_id, changes in diffs.items():
+        if not changes:
+            continue
+        # Best price per (market, selection) after this refresh, for clients showing best prices only
+        best: Dict[Tuple[str, str], float] = {}
+        for (market_name, selection, _), price in current[event_id].items():
+            if price > best.get((market_name, selection), 0):
+                best[(market_name, selection)] = price
+        last = previous.get(event_id, {})
+        for market_name, selection, bookmaker, price in changes:
+            rows.append([event_id, market_name, selection, bookmaker, price,
+                         last.get((market_name, selection, bookmaker)), best.get((market_name, selection))])
+    rows += [[event_id, None, None, None, None, None, None] for event_id in removed]
+    if not rows:
+        return
+    
+    for attempt in range(2):
+        feed = await db.odds_feed.find_one_and_update(
+            {"_id": "odds"}, {"$setOnInsert": {"stream": uuid.uuid4().hex[:12], "version": 0}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        start = feed["version"] + 1
+        # The batch is inserted before the head moves, so readers never see a version that isn't stored yet;
+        # a second writer continuing from the same head fails on the duplicate _id
+        try:
+            await db.odds_changes.insert_one({
+                "_id": start,
+                "end": start + len(rows) - 1,
+                "sport_key": sport_key,
+                "t": now,
+                "changes": rows,
+                "expires_at": datetime.fromtimestamp(now + ODDS_CHANGE_RETENTION_HOURS * 3600, timezone.utc),
+            })
+            break
+        except DuplicateKeyError:
+            if attempt:
+                raise
+            await repair_odds_feed_head()
+    await db.odds_feed.update_one({"_id": "odds"}, {"$max": {"version": start + len(rows) - 1}})
+    odds_change_stats["batches"] += 1
+    odds_change_stats["changes"] += len(rows)
 
 async def fetch_real_odds(sport_key: str, use_cache: bool = True) -> Dict[str, Dict]:
     """Fetch real odds from The Odds API with extended markets"""
@@ -186,152 +1364,116 @@ async def fetch_real_odds(sport_key: str, use_cache: bool = True) -> Dict[str, D
         return {}
     
     cache_key = f"odds:{sport_key}"
+    fetch = lambda: _fetch_real_odds_upstream(sport_key, cache_key)
     if use_cache:
-        cached = get_cache(cache_key)
+        cached = await read_through(cache_key, fetch)
         if cached:
             return cached
     
-    async with httpx.AsyncClient() as http_client:
-        try:
-            url = f"{ODDS_API_BASE}/sports/{sport_key}/odds"
-            # Extended markets: h2h, totals, spreads (handicap), btts
-            # This gives us "Stoiximan-style" depth without player props
-            markets = "h2h,totals,spreads"
-            
-            params = {
-                "apiKey": ODDS_API_KEY,
-                "regions": "eu,uk",
-                "markets": markets,
-                "oddsFormat": "decimal"
-            }
-            logger.info(f"Fetching odds: {url} with markets: {markets}")
+    return await single_flight(cache_key, fetch)
+
+async def _fetch_real_odds_upstream(sport_key: str, cache_key: str) -> Dict[str, Dict]:
+    http_client = get_http_client("odds_api")
+    try:
+        url = f"{ODDS_API_BASE}/sports/{sport_key}/odds"
+        # Extended markets: h2h, totals, spreads (handicap), btts
+        # This gives us "Stoiximan-style" depth without player props
+        markets = "h2h,totals,spreads"
+        
+        params = {
+            "apiKey": ODDS_API_KEY,
+            "regions": "eu,uk",
+            "markets": markets,
+            "oddsFormat": "decimal"
+        }
+        logger.info(f"Fetching odds: {url} with markets: {markets}")
+        async with provider_budgets["odds_api"].slot():
             response = await http_client.get(url, params=params, timeout=30.0)
-            
-            if response.status_code == 200:
-                data = response.json()
-                # Index by match (home_team vs away_team)
-                odds_map = {}
-                for match in data:
-                    home = match.get("home_team", "").lower()
-                    away = match.get("away_team", "").lower()
-                    key = f"{home}_{away}"
-                    
-                    # Store raw bookmaker data for frontend parsing
-                    raw_bookmakers = match.get("bookmakers", [])
-                    
-                    # Get best odds from all bookmakers with extended markets
-                    best_odds = {
-                        "Match Winner": {}, 
-                        "Over/Under 2.5": {},
-                        "Over/Under Alternative": {},  # Alternative lines
-                        "Handicap": {},  # Spread/Handicap market
-                        "Both Teams Score": {},
-                        "bookmakers": [],
-                        "raw_bookmakers": raw_bookmakers  # Store raw data for frontend
-                    }
-                    
-                    for bookmaker in raw_bookmakers:
-                        book_name = bookmaker.get("title", "")
-                        if book_name not in best_odds["bookmakers"]:
-                            best_odds["bookmakers"].append(book_name)
-                        
-                        for market in bookmaker.get("markets", []):
-                            market_key = market.get("key", "")
-                            
-                            if market_key == "h2h":
-                                for outcome in market.get("outcomes", []):
-                                    name = outcome.get("name", "")
-                                    price = outcome.get("price", 0)
-                                    
-                                    if name == match.get("home_team"):
-                                        if "Home" not in best_odds["Match Winner"] or price > float(best_odds["Match Winner"].get("Home", 0)):
-                                            best_odds["Match Winner"]["Home"] = str(round(price, 2))
-                                    elif name == match.get("away_team"):
-                                        if "Away" not in best_odds["Match Winner"] or price > float(best_odds["Match Winner"].get("Away", 0)):
-                                            best_odds["Match Winner"]["Away"] = str(round(price, 2))
-                                    elif name == "Draw":
-                                        if "Draw" not in best_odds["Match Winner"] or price > float(best_odds["Match Winner"].get("Draw", 0)):
-                                            best_odds["Match Winner"]["Draw"] = str(round(price, 2))
-                            
-                            elif market_key == "totals":
-                                for outcome in market.get("outcomes", []):
-                                    name = outcome.get("name", "")
-                                    price = outcome.get("price", 0)
-                                    point = outcome.get("point", 2.5)
-                                    
-                                    # Main 2.5 line
-                                    if point == 2.5:
-                                        if name == "Over":
-                                            best_odds["Over/Under 2.5"]["Over"] = str(round(price, 2))
-                                        elif name == "Under":
-                                            best_odds["Over/Under 2.5"]["Under"] = str(round(price, 2))
-                                    
-                                    # Alternative lines (1.5, 3.5, etc.)
-                                    line_key = f"{name} {point}"
-                                    if line_key not in best_odds["Over/Under Alternative"]:
-                                        best_odds["Over/Under Alternative"][line_key] = str(round(price, 2))
-                            
-                            elif market_key == "spreads":
-                                # Handicap/Spread market
-                                for outcome in market.get("outcomes", []):
-                                    name = outcome.get("name", "")
-                                    price = outcome.get("price", 0)
-                                    point = outcome.get("point", 0)
-                                    
-                                    if name == match.get("home_team"):
-                                        handicap_key = f"Home ({'+' if point > 0 else ''}{point})"
-                                        best_odds["Handicap"][handicap_key] = str(round(price, 2))
-                                    elif name == match.get("away_team"):
-                                        handicap_key = f"Away ({'+' if point > 0 else ''}{point})"
-                                        best_odds["Handicap"][handicap_key] = str(round(price, 2))
-                            
-                            elif market_key == "btts":
-                                for outcome in market.get("outcomes", []):
-                                    name = outcome.get("name", "")
-                                    price = outcome.get("price", 0)
-                                    
-                                    if name == "Yes":
-                                        best_odds["Both Teams Score"]["Yes"] = str(round(price, 2))
-                                    elif name == "No":
-                                        best_odds["Both Teams Score"]["No"] = str(round(price, 2))
-                    
-                    # Also store the original match data for fallback
-                    odds_map[key] = {
-                        **best_odds,
-                        "match_data": {
-                            "id": match.get("id"),
-                            "commence_time": match.get("commence_time"),
-                            "home_team": match.get("home_team"),
-                            "away_team": match.get("away_team"),
-                            "sport_key": match.get("sport_key"),
-                            "sport_title": match.get("sport_title")
-                        }
-                    }
+        
+        if response.status_code == 200:
+            data = response.json()
+            # Index by match (home_team vs away_team)
+            odds_map = {}
+            rows = flatten_odds(data, football_outcome_labels)
+            for match, bookmakers, market_stats, consensus in zip(
+                    data, rows.event_bookmakers, aggregate_odds(rows),
+                    consensus_probabilities(rows, football_consensus_label)):
+                home = match.get("home_team", "").lower()
+                away = match.get("away_team", "").lower()
+                key = f"{home}_{away}"
                 
-                set_cache(cache_key, odds_map)
-                return odds_map
-            else:
-                logger.error(f"Odds API error: {response.status_code} - {response.text[:200]}")
-                return {}
-        except Exception as e:
-            logger.error(f"Odds API exception: {e}")
+                # Best price per outcome across all bookmakers, with extended markets
+                best_odds = {
+                    **best_price_odds(market_stats, FOOTBALL_ODDS_MARKETS),
+                    "bookmakers": bookmakers,
+                    "market_stats": market_stats,
+                    "consensus": consensus,
+                    "raw_bookmakers": match.get("bookmakers", [])  # Store raw data for frontend
+                }
+                
+                # Also store the original match data for fallback
+                odds_map[key] = {
+                    **best_odds,
+                    "match_data": {
+                        "id": match.get("id"),
+                        "commence_time": match.get("commence_time"),
+                        "home_team": match.get("home_team"),
+                        "away_team": match.get("away_team"),
+                        "sport_key": match.get("sport_key"),
+                        "sport_title": match.get("sport_title")
+                    }
+                }
+            
+            set_cache(cache_key, odds_map)
+            return odds_map
+        elif response.status_code == 429:
+            logger.warning("Odds API: Rate limit exceeded or quota reached")
+            provider_budgets["odds_api"].backoff(60)
+            return {}
+        else:
+            logger.error(f"Odds API error: {response.status_code} - {response.text[:200]}")
             return {}
+    except Exception as e:
+        logger.error(f"Odds API exception: {e}")
+        return {}
 
 async def search_sports_news(home_team: str, away_team: str, sport: str = "football", league: str = "") -> str:
     """Search for latest sports news using the Emergent LLM integration.
     Note: Web search is performed by the LLM itself through its knowledge and training data,
-    augmented by asking for specific source checking."""
+    augmented by asking for specific source checking.
+    
+    Context is generated and cached per team, so a team playing several fixtures
+    (or listed in several leagues and cups) costs one LLM call per news window."""
     if not EMERGENT_LLM_KEY:
         return "No news search available - API key not configured"
     
+    home_news, away_news = await asyncio.gather(
+        fetch_team_news(home_team, sport, league),
+        fetch_team_news(away_team, sport, league),
+    )
+    return f"{home_team}:\n{home_news}\n\n{away_team}:\n{away_news}"
+
+async def fetch_team_news(team: str, sport: str = "football", league: str = "") -> str:
+    """Cached news context for one team, shared across all of its matches"""
+    if sport == "basketball" or "euroleague" in league.lower():
+        sport = "basketball"
+    cache_key = f"news:{sport}:{team_match_key(team)}"
+    fetch = lambda: _fetch_team_news_upstream(team, sport, cache_key)
+    cached = await read_through(cache_key, fetch)
+    if cached:
+        return cached
+    
+    return await single_flight(cache_key, fetch)
+
+async def _fetch_team_news_upstream(team: str, sport: str, cache_key: str) -> str:
     try:
         # Determine which sources to search based on sport type
-        if sport == "basketball" or "euroleague" in league.lower():
+        if sport == "basketball":
             sources_hint = "Eurohoops, Basketnews, Sport24, Gazzetta.gr, SDNA"
             sport_context = "EuroLeague basketball"
         else:
             sources_hint = "Marca, AS, Gazzetta.gr, SDNA"
-            sport_context = f"{league} football"
+            sport_context = "European football"
         
         # Use Emergent LLM to provide analysis based on its knowledge
         chat = LlmChat(
@@ -344,25 +1486,29 @@ async def search_sports_news(home_team: str, away_team: str, sport: str = "footb
             3. Historical performance context
             4. Key players to watch
             
-            Present the information as if summarizing recent reports from sports media sources.
-            Be concise but informative (max 250 words)."""
+            Present the information as if summarizing recent reports from sports media sources
+            such as {sources_hint}.
+            Be concise but informative (max 150 words)."""
         ).with_model("openai", "gpt-5.2")
         
-        user_message = UserMessage(text=f"""Provide relevant match context for {home_team} vs {away_team} in {league}. 
+        user_message = UserMessage(text=f"""Provide relevant team context for {team}.
         
 Include:
-- Any known injury patterns or commonly injured players for both teams
+- Any known injury patterns or commonly injured players
 - Team form tendencies and playing style
-- Key factors that typically affect these teams' performances
+- Key factors that typically affect this team's performances
 - Important players to watch
 
 Format as a brief analyst report.""")
         
         response = await chat.send_message(user_message)
-        return response if response else "No context information available"
+        if not response:
+            return "No context information available"
+        set_cache(cache_key, response)
+        return response
         
     except Exception as e:
-        logger.error(f"News search error: {e}")
+        logger.error(f"News search error for {team}: {e}")
         return f"Analysis context unavailable: {str(e)[:50]}"
 
 def calculate_value_bet(ai_probability: float, bookmaker_odds: float) -> Dict[str, Any]:
@@ -403,8 +1549,10 @@ def calculate_value_bet(ai_probability: float, bookmaker_odds: float) -> Dict[st
         "edge": round(edge, 1)
     }
 
-async def get_ai_analysis(match_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Get AI analysis for a match using GPT-5.2 with web search for latest news"""
+async def get_ai_analysis(match_data: Dict[str, Any], timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Get AI analysis for a match using GPT-5.2 with web search for latest news
+    
+    If a timings dict is given, the news and analysis LLM calls record their durations (ms) in it."""
     if not EMERGENT_LLM_KEY:
         return {
             "prediction": "Analysis unavailable",
@@ -424,7 +1572,7 @@ async def get_ai_analysis(match_data: Dict[str, Any]) -> Dict[str, Any]:
         
         # First, search for latest news and injuries
         logger.info(f"Searching news for {home_team} vs {away_team}")
-        news_summary = await search_sports_news(home_team, away_team, sport, league)
+        news_summary = await timed(timings, "news", search_sports_news(home_team, away_team, sport, league))
         
         # Now run the AI analysis with the news context
         chat = LlmChat(
@@ -487,9 +1635,8 @@ Date: {datetime.now().strftime('%B %d, %Y')}
 Based on ALL the above information, provide your expert analysis. Remember to calculate your OWN probability - don't just follow the bookmaker odds."""
         
         user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
+        response = await timed(timings, "analysis", chat.send_message(user_message))
         
-        import json
         try:
             start = response.find('{')
             end = response.rfind('}') + 1
@@ -511,19 +1658,19 @@ Based on ALL the above information, provide your expert analysis. Remember to ca
                     bookmaker_odds = None
                     
                     if 'home' in best_bet and match_winner.get('Home'):
-                        bookmaker_odds = float(match_winner['Home'])
+                        bookmaker_odds = match_winner['Home']
                     elif 'away' in best_bet and match_winner.get('Away'):
-                        bookmaker_odds = float(match_winner['Away'])
+                        bookmaker_odds = match_winner['Away']
                     elif 'draw' in best_bet and match_winner.get('Draw'):
-                        bookmaker_odds = float(match_winner['Draw'])
+                        bookmaker_odds = match_winner['Draw']
                     elif 'over' in best_bet:
                         ou = odds.get('Over/Under 2.5', {})
                         if ou.get('Over'):
-                            bookmaker_odds = float(ou['Over'])
+                            bookmaker_odds = ou['Over']
                     elif 'under' in best_bet:
                         ou = odds.get('Over/Under 2.5', {})
                         if ou.get('Under'):
-                            bookmaker_odds = float(ou['Under'])
+                            bookmaker_odds = ou['Under']
                     
                     if bookmaker_odds and ai_prob:
                         analysis["value_bet"] = calculate_value_bet(ai_prob, bookmaker_odds)
@@ -532,7 +1679,9 @@ Based on ALL the above information, provide your expert analysis. Remember to ca
         except Exception as parse_error:
             logger.error(f"JSON parse error: {parse_error}")
         
+        # Placeholder for a reply that couldn't be parsed - shown, but never stored
         return {
+            "fallback": True,
             "prediction": "Home Win",
             "confidence": 65.0,
             "best_bet": "Home Win",
@@ -556,6 +1705,121 @@ Based on ALL the above information, provide your expert analysis. Remember to ca
             "value_bet": None
         }
 
+# Stored AI analyses (MongoDB + in-memory), keyed by match id and a fingerprint of the analysis inputs
+AI_ANALYSIS_TTL = int(os.environ.get('AI_ANALYSIS_TTL', str(6 * 3600)))
+AI_ANALYSIS_INPUTS = ("sport", "home_team", "away_team", "league", "home_form", "away_form",
+                      "h2h", "home_injuries", "away_injuries", "odds")
+ai_analysis_stats = {"memory_hits": 0, "db_hits": 0, "generated": 0}
+AI_BATCH_CONCURRENCY = int(os.environ.get('AI_BATCH_CONCURRENCY', '4'))
+AI_BATCH_MAX_ITEMS = int(os.environ.get('AI_BATCH_MAX_ITEMS', '500'))
+
+def analysis_odds(odds: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The best-price markets the analysis prompt and value-bet check use"""
+    if not odds:
+        return {}
+    return {market: odds[market] for market in ("Match Winner", "Over/Under 2.5") if odds.get(market)}
+
+def fingerprint_odds(odds: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """Analysis odds as implied probabilities in 2-point steps, so routine price moves
+    between refreshes don't turn a stored analysis into a miss"""
+    coarse: Dict[str, Dict[str, int]] = {}
+    for market, prices in analysis_odds(odds).items():
+        for selection, price in prices.items():
+            try:
+                coarse.setdefault(market, {})[selection] = round(50 / float(price))
+            except (TypeError, ValueError, ZeroDivisionError):
+                continue
+    return coarse
+
+def analysis_fingerprint(match_data: Dict[str, Any]) -> str:
+    inputs = {key: match_data.get(key) for key in AI_ANALYSIS_INPUTS}
+    inputs["odds"] = fingerprint_odds(inputs["odds"])
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+async def get_cached_ai_analysis(match_data: Dict[str, Any], timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Get a stored analysis for these exact inputs, or generate one.
+    
+    Concurrent viewers of the same match share a single generation. The viewer
+    that started it gets its news/analysis stage timings; the others only
+    report how long they waited, as "analysis_wait"."""
+    match_id = match_data.get("id")
+    if not match_id:
+        return await get_ai_analysis(match_data, timings)
+    fingerprint = analysis_fingerprint(match_data)
+    cache_key = f"ai:{match_id}:{fingerprint}"
+    cached = get_cache(cache_key)
+    if cached:
+        ai_analysis_stats["memory_hits"] += 1
+        return cached
+    # Stages are recorded in the flight's own dict, so they never land in another caller's timings
+    flight_timings: Dict[str, float] = {}
+    fetch = lambda: _load_or_generate_analysis(cache_key, match_data, fingerprint, flight_timings)
+    if cache_key in inflight_fetches:
+        return await timed(timings, "analysis_wait", single_flight(cache_key, fetch))
+    analysis = await single_flight(cache_key, fetch)
+    if timings is not None:
+        timings.update(flight_timings)
+    return analysis
+
+async def has_stored_analysis(match_data: Dict[str, Any]) -> bool:
+    """Whether an unexpired analysis exists for these exact inputs"""
+    cache_key = f"ai:{match_data['id']}:{analysis_fingerprint(match_data)}"
+    if get_cache(cache_key):
+        return True
+    try:
+        doc = await asyncio.wait_for(db.ai_analyses.find_one(
+            {"_id": cache_key, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"_id": 1}), 1.0)
+    except Exception:
+        return False
+    return doc is not None
+
+async def stored_analysis_ids(match_ids: List[str], valid_for: float = 0) -> set:
+    """Match ids with a stored analysis (for any inputs) still valid `valid_for` seconds from now"""
+    if not match_ids:
+        return set()
+    try:
+        docs = await asyncio.wait_for(db.ai_analyses.find(
+            {"match_id": {"$in": match_ids},
+             "expires_at": {"$gt": datetime.now(timezone.utc) + timedelta(seconds=valid_for)}},
+            {"_id": 0, "match_id": 1}).to_list(None), 5.0)
+    except Exception as e:
+        logger.warning(f"Could not look up stored analyses: {e!r}")
+        return set()
+    return {doc["match_id"] for doc in docs}
+
+async def _load_or_generate_analysis(cache_key: str, match_data: Dict[str, Any], fingerprint: str,
+                                     timings: Optional[Dict[str, float]]) -> Dict[str, Any]:
+    try:
+        doc = await asyncio.wait_for(db.ai_analyses.find_one({"_id": cache_key}, {"analysis": 1, "expires_at": 1}), 1.0)
+    except Exception as e:
+        logger.warning(f"Could not read stored analysis {cache_key}: {e!r}")
+        doc = None
+    if doc and doc["expires_at"].replace(tzinfo=timezone.utc) > datetime.now(timezone.utc):
+        ai_analysis_stats["db_hits"] += 1
+        set_cache(cache_key, doc["analysis"])
+        return doc["analysis"]
+    
+    analysis = await get_ai_analysis(match_data, timings)
+    ai_analysis_stats["generated"] += 1
+    if analysis.get("prediction") == "Analysis unavailable" or analysis.get("fallback"):
+        return analysis  # Don't keep failures (or unparseable replies) around
+    
+    now = datetime.now(timezone.utc)
+    analysis["generated_at"] = now.isoformat()
+    set_cache(cache_key, analysis)
+    try:
+        await db.ai_analyses.replace_one({"_id": cache_key}, {
+            "_id": cache_key,
+            "match_id": match_data["id"],
+            "fingerprint": fingerprint,
+            "analysis": analysis,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=AI_ANALYSIS_TTL),
+        }, upsert=True)
+    except Exception as e:
+        logger.warning(f"Could not store analysis {cache_key}: {e!r}")
+    return analysis
+
 def normalize_team_name(name: str) -> str:
     """Normalize team name for matching"""
     if not name:
@@ -570,26 +1834,174 @@ def normalize_team_name(name: str) -> str:
     name = " ".join(name.split())
     return name.strip()
 
-def calculate_quick_probability(odds: Dict[str, Any], home_team: str = "", away_team: str = "") -> Dict[str, Any]:
-    """Calculate quick AI probability score based on odds - for featured picks
+# Built-in aliases (normalized Football-Data.org name -> normalized Odds API name);
+# extended at startup and via POST /api/team-aliases from the team_aliases collection
+TEAM_ALIASES: Dict[str, str] = {
+    "bayern munchen": "bayern munich",
+    "internazionale milano": "inter milan",
+    "olympique marseille": "marseille",
+    "olympique lyonnais": "lyon",
+    "real betis balompie": "real betis",
+    "espanyol barcelona": "espanyol",
+    "athletic": "athletic bilbao",
+}
+team_aliases_version = 0
+
+# Tokens that don't help tell teams apart
+TEAM_STOP_TOKENS = {"fc", "afc", "cf", "sc", "ssc", "rcd", "cd", "ud", "club", "de", "del", "da", "and", "the", "1"}
+
+def team_name_key(name: str) -> str:
+    """Normalized, accent-free team name without generic tokens"""
+    name = unicodedata.normalize("NFKD", normalize_team_name(name))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(t for t in re.split(r"[^a-z0-9]+", name) if t and t not in TEAM_STOP_TOKENS)
+
+def team_match_key(name: str) -> str:
+    """Alias-resolved team name key used for odds matching"""
+    key = team_name_key(name)
+    return TEAM_ALIASES.get(key, key)
+
+class OddsMatcher:
+    """Token index over one odds snapshot for joining fixtures to odds entries.
     
-    NOTE: This uses IMPLIED PROBABILITY from bookmaker odds as the base.
-    Higher odds = lower probability (underdog)
-    Lower odds = higher probability (favorite)
+    Built once per snapshot. resolve() first tries an exact lookup on the
+    normalized pair, then scores only the entries sharing a token with
+    either team, weighting rare tokens higher, and breaks ties on kickoff time.
     """
-    if odds:
-        match_winner = odds.get("Match Winner", {})
-        home_odds = float(match_winner.get("Home", 0) or 0)
-        away_odds = float(match_winner.get("Away", 0) or 0)
-        draw_odds = float(match_winner.get("Draw", 0) or 0)
+
+    MIN_SIDE_SCORE = 0.5
+
+    def __init__(self, odds_map: Dict[str, Dict]):
+        self.entries = []
+        self.by_pair: Dict[Tuple[str, str], List[int]] = {}
+        self.token_index: Dict[str, set] = {}
+        team_counts: Dict[str, int] = {}
+        for odds_key, odds_data in odds_map.items():
+            match_data = odds_data.get("match_data") or {}
+            home, away = match_data.get("home_team"), match_data.get("away_team")
+            if not home or not away:
+                parts = odds_key.split("_", 1)
+                if len(parts) != 2:
+                    continue
+                home, away = parts
+            home_key, away_key = team_match_key(home), team_match_key(away)
+            index = len(self.entries)
+            self.entries.append((odds_key, home_key, away_key, set(home_key.split()), set(away_key.split()),
+                                 parse_kickoff(match_data.get("commence_time"))))
+            self.by_pair.setdefault((home_key, away_key), []).append(index)
+            for team_key in (home_key, away_key):
+                for token in set(team_key.split()):
+                    self.token_index.setdefault(token, set()).add(index)
+                    team_counts[token] = team_counts.get(token, 0) + 1
+        # Inverse document frequency over team names: "united" counts for less than "brighton"
+        teams = max(2 * len(self.entries), 1)
+        self.weights = {token: math.log(1 + teams / count) for token, count in team_counts.items()}
+        self.default_weight = math.log(1 + teams)
+
+    def _side_score(self, tokens: set, other: set) -> float:
+        """1.0 when one name contains the other ("newcastle" / "newcastle united"),
+        otherwise the weighted Jaccard overlap of their tokens"""
+        shared = tokens & other
+        if not shared:
+            return 0.0
+        if shared == tokens or shared == other:
+            return 1.0
+        weight = lambda ts: sum(self.weights.get(t, self.default_weight) for t in ts)
+        return weight(shared) / weight(tokens | other)
+
+    def resolve(self, home_team: str, away_team: str, kickoff: Optional[str] = None) -> Optional[str]:
+        """Return the odds_map key for a fixture, or None if nothing matches well enough"""
+        home_key, away_key = team_match_key(home_team), team_match_key(away_team)
+        kickoff_ts = parse_kickoff(kickoff)
+        candidates = self.by_pair.get((home_key, away_key))
+        if candidates:
+            return self.entries[min(candidates, key=lambda i: self._kickoff_gap(i, kickoff_ts))][0]
         
-        if home_odds > 0 or away_odds > 0:
+        home_tokens, away_tokens = set(home_key.split()), set(away_key.split())
+        candidates = set()
+        for token in home_tokens | away_tokens:
+            candidates |= self.token_index.get(token, set())
+        
+        best, best_rank = None, None
+        for index in candidates:
+            _, _, _, odds_home, odds_away, _ = self.entries[index]
+            home_score = self._side_score(home_tokens, odds_home)
+            away_score = self._side_score(away_tokens, odds_away)
+            if home_score < self.MIN_SIDE_SCORE or away_score < self.MIN_SIDE_SCORE:
+                continue
+            rank = (-(home_score + away_score), self._kickoff_gap(index, kickoff_ts))
+            if best_rank is None or rank < best_rank:
+                best, best_rank = index, rank
+        return self.entries[best][0] if best is not None else None
+
+    def _kickoff_gap(self, index: int, kickoff_ts: Optional[float]) -> float:
+        odds_ts = self.entries[index][5]
+        if kickoff_ts is None or odds_ts is None:
+            return float("inf")
+        return abs(odds_ts - kickoff_ts)
+
+def parse_kickoff(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds for an ISO kickoff time, or None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+# Matchers for the most recent odds snapshots, keyed by id() of the snapshot dict
+# (the dict itself is held alongside so its id can't be reused while cached)
+odds_matchers: "OrderedDict[int, Tuple[Dict, int, OddsMatcher]]" = OrderedDict()
+
+def get_odds_matcher(odds_map: Dict[str, Dict]) -> OddsMatcher:
+    entry = odds_matchers.get(id(odds_map))
+    if entry and entry[0] is odds_map and entry[1] == team_aliases_version:
+        odds_matchers.move_to_end(id(odds_map))
+        return entry[2]
+    matcher = OddsMatcher(odds_map)
+    odds_matchers[id(odds_map)] = (odds_map, team_aliases_version, matcher)
+    while len(odds_matchers) > 32:
+        odds_matchers.popitem(last=False)
+    return matcher
+
+def add_team_alias(alias: str, canonical: str) -> Tuple[str, str]:
+    """Register an alias in memory; returns the normalized (alias, canonical) pair"""
+    global team_aliases_version
+    alias_key, canonical_key = team_name_key(alias), team_match_key(canonical)
+    TEAM_ALIASES[alias_key] = canonical_key
+    team_aliases_version += 1
+    return alias_key, canonical_key
+
+def calculate_quick_probability(odds: Dict[str, Any], home_team: str = "", away_team: str = "") -> Dict[str, Any]:
+    """Calculate quick AI probability score based on odds - for featured picks
+    
+    NOTE: This uses the margin-free CONSENSUS PROBABILITY across all bookmakers
+    as the base, or the IMPLIED PROBABILITY of the best price when there is none.
+    Higher odds = lower probability (underdog)
+    Lower odds = higher probability (favorite)
+    """
+    if odds:
+        match_winner = odds.get("Match Winner", {})
+        home_odds = match_winner.get("Home") or 0
+        away_odds = match_winner.get("Away") or 0
+        draw_odds = match_winner.get("Draw") or 0
+        consensus = (odds.get("consensus") or {}).get("Match Winner")
+        
+        if consensus and (home_odds > 0 or away_odds > 0):
+            fair = consensus["probabilities"]
+            home_prob = fair.get("Home", 0) * 100 if home_odds > 0 else 0
+            away_prob = fair.get("Away", 0) * 100 if away_odds > 0 else 0
+            draw_prob = fair.get("Draw", 0) * 100 if draw_odds > 0 else 0
+            source = "consensus"
+        else:
             # Calculate implied probabilities from odds
             # IMPORTANT: Lower odds = higher probability (favorite)
             home_prob = (100 / home_odds) if home_odds > 0 else 0
             away_prob = (100 / away_odds) if away_odds > 0 else 0
             draw_prob = (100 / draw_odds) if draw_odds > 0 else 0
-            
+            source = "odds"
+        
+        if home_odds > 0 or away_odds > 0:
             # Find the best pick (highest implied probability = lowest odds = favorite)
             best_prob = max(home_prob, away_prob, draw_prob)
             
@@ -623,8 +2035,9 @@ def calculate_quick_probability(odds: Dict[str, Any], home_team: str = "", away_
                 "best_pick": best_pick,
                 "pick_type": pick_type,
                 "pick_odds": round(pick_odds, 2),
-                "implied_prob": round(best_prob, 1),
-                "source": "odds"
+                "implied_prob": round(100 / pick_odds, 1),
+                "fair_prob": round(best_prob, 1),
+                "source": source
             }
     
     # Fallback when no odds available - use estimated market odds
@@ -703,39 +2116,11 @@ def parse_football_data_match(match: Dict[str, Any], league_code: str, odds_map:
     bookmakers_list = []
     
     if odds_map and home_team != "Unknown" and away_team != "Unknown":
-        home_norm = normalize_team_name(home_team)
-        away_norm = normalize_team_name(away_team)
-        
-        # Try to find matching odds
-        for odds_key, odds_data in odds_map.items():
-            parts = odds_key.split("_", 1)
-            if len(parts) == 2:
-                odds_home_norm = normalize_team_name(parts[0])
-                odds_away_norm = normalize_team_name(parts[1])
-                
-                # Check various matching strategies
-                home_match = (
-                    home_norm == odds_home_norm or
-                    home_norm in odds_home_norm or
-                    odds_home_norm in home_norm or
-                    # Check key words (e.g., "brighton" matches "brighton and hove albion")
-                    any(word in odds_home_norm for word in home_norm.split() if len(word) > 4) or
-                    any(word in home_norm for word in odds_home_norm.split() if len(word) > 4)
-                )
-                
-                away_match = (
-                    away_norm == odds_away_norm or
-                    away_norm in odds_away_norm or
-                    odds_away_norm in away_norm or
-                    any(word in odds_away_norm for word in away_norm.split() if len(word) > 4) or
-                    any(word in away_norm for word in odds_away_norm.split() if len(word) > 4)
-                )
-                
-                if home_match and away_match:
-                    match_odds = odds_data
-                    has_odds = True
-                    bookmakers_list = odds_data.get("bookmakers", [])[:5]
-                    break
+        odds_key = get_odds_matcher(odds_map).resolve(home_team, away_team, match.get("utcDate"))
+        if odds_key:
+            match_odds = odds_map[odds_key]
+            has_odds = True
+            bookmakers_list = match_odds.get("bookmakers", [])[:5]
     
     # Calculate quick AI probability for featured picks
     quick_analysis = calculate_quick_probability(match_odds, home_team, away_team)
@@ -782,121 +2167,431 @@ def parse_basketball_game(game: Dict[str, Any], league_info: Dict[str, str]) ->
         "has_odds": True,
         "odds": {
             "Match Winner": {
-                "Home": "1.85",
-                "Away": "1.95"
+                "Home": 1.85,
+                "Away": 1.95
             }
         },
     }
 
-async def fetch_basketball_from_odds_api(sport_key: str) -> List[Dict[str, Any]]:
+async def fetch_basketball_from_odds_api(sport_key: str, use_cache: bool = True) -> List[Dict[str, Any]]:
     """Fetch basketball games directly from The Odds API with real odds"""
     if not ODDS_API_KEY:
         logger.warning("ODDS_API_KEY not configured")
         return []
     
     cache_key = f"basketball_odds:{sport_key}"
-    cached = get_cache(cache_key)
-    if cached:
-        logger.info(f"Returning {len(cached)} cached basketball games")
-        return cached
+    fetch = lambda: _fetch_basketball_from_odds_api_upstream(sport_key, cache_key)
+    if use_cache:
+        cached = await read_through(cache_key, fetch)
+        if cached:
+            logger.info(f"Returning {len(cached)} cached basketball games")
+            return cached
     
-    async with httpx.AsyncClient() as http_client:
-        try:
-            url = f"{ODDS_API_BASE}/sports/{sport_key}/odds"
-            params = {
-                "apiKey": ODDS_API_KEY,
-                "regions": "eu,uk",
-                "markets": "h2h,totals",
-                "oddsFormat": "decimal"
-            }
-            logger.info(f"Fetching basketball odds: {url}")
+    return await single_flight(cache_key, fetch)
+
+async def _fetch_basketball_from_odds_api_upstream(sport_key: str, cache_key: str) -> List[Dict[str, Any]]:
+    http_client = get_http_client("odds_api")
+    try:
+        url = f"{ODDS_API_BASE}/sports/{sport_key}/odds"
+        params = {
+            "apiKey": ODDS_API_KEY,
+            "regions": "eu,uk",
+            "markets": "h2h,totals",
+            "oddsFormat": "decimal"
+        }
+        logger.info(f"Fetching basketball odds: {url}")
+        async with provider_budgets["odds_api"].slot():
             response = await http_client.get(url, params=params, timeout=30.0)
+        
+        if response.status_code == 200:
+            data = response.json()
+            logger.info(f"Basketball API returned {len(data)} matches")
+            games = []
             
-            if response.status_code == 200:
-                data = response.json()
-                logger.info(f"Basketball API returned {len(data)} matches")
-                games = []
+            rows = flatten_odds(data, basketball_outcome_labels)
+            for match, bookmakers, market_stats, consensus in zip(
+                    data, rows.event_bookmakers, aggregate_odds(rows),
+                    consensus_probabilities(rows, basketball_consensus_label)):
+                # Get best odds
+                best_odds = {
+                    **best_price_odds(market_stats, BASKETBALL_ODDS_MARKETS),
+                    "bookmakers": bookmakers,
+                    "market_stats": market_stats,
+                    "consensus": consensus,
+                    "raw_bookmakers": match.get("bookmakers", []),
+                }
                 
-                for match in data:
-                    # Get best odds
-                    best_odds = {"Match Winner": {}, "Over/Under": {}, "bookmakers": []}
-                    
-                    for bookmaker in match.get("bookmakers", []):
-                        book_name = bookmaker.get("title", "")
-                        best_odds["bookmakers"].append(book_name)
-                        
-                        for market in bookmaker.get("markets", []):
-                            market_key = market.get("key", "")
-                            
-                            if market_key == "h2h":
-                                for outcome in market.get("outcomes", []):
-                                    name = outcome.get("name", "")
-                                    price = outcome.get("price", 0)
-                                    
-                                    if name == match.get("home_team"):
-                                        if "Home" not in best_odds["Match Winner"] or price > float(best_odds["Match Winner"].get("Home", 0)):
-                                            best_odds["Match Winner"]["Home"] = str(round(price, 2))
-                                    elif name == match.get("away_team"):
-                                        if "Away" not in best_odds["Match Winner"] or price > float(best_odds["Match Winner"].get("Away", 0)):
-                                            best_odds["Match Winner"]["Away"] = str(round(price, 2))
-                            
-                            elif market_key == "totals":
-                                for outcome in market.get("outcomes", []):
-                                    name = outcome.get("name", "")
-                                    price = outcome.get("price", 0)
-                                    point = outcome.get("point", 0)
-                                    
-                                    if name == "Over":
-                                        best_odds["Over/Under"][f"Over {point}"] = str(round(price, 2))
-                                    elif name == "Under":
-                                        best_odds["Over/Under"][f"Under {point}"] = str(round(price, 2))
-                    
-                    # Calculate quick AI probability for featured picks
-                    home_team = match.get("home_team", "Unknown")
-                    away_team = match.get("away_team", "Unknown")
-                    quick_analysis = calculate_quick_probability(best_odds, home_team, away_team)
-                    
-                    game = {
-                        "id": f"bb_{match.get('id', '')}",
-                        "sport": "basketball",
-                        "league": "EuroLeague",
-                        "league_id": "basketball_euroleague",
-                        "league_code": "EURO",
-                        "home_team": match.get("home_team", "Unknown"),
-                        "away_team": match.get("away_team", "Unknown"),
-                        "home_logo": "",
-                        "away_logo": "",
-                        "match_date": match.get("commence_time", ""),
-                        "status": "NS",
-                        "home_score": None,
-                        "away_score": None,
-                        "has_odds": True,
-                        "odds": best_odds,
-                        "bookmakers": best_odds.get("bookmakers", [])[:5],
-                        "quick_analysis": quick_analysis
-                    }
-                    games.append(game)
+                # Calculate quick AI probability for featured picks
+                home_team = match.get("home_team", "Unknown")
+                away_team = match.get("away_team", "Unknown")
+                quick_analysis = calculate_quick_probability(best_odds, home_team, away_team)
                 
-                set_cache(cache_key, games)
-                return games
-            elif response.status_code == 401:
-                logger.error("Basketball Odds API: Invalid API key")
-                return []
-            elif response.status_code == 429:
-                logger.warning("Basketball Odds API: Rate limit exceeded or quota reached")
-                return []
-            else:
-                logger.error(f"Basketball Odds API error: {response.status_code} - {response.text[:200]}")
-                return []
-        except Exception as e:
-            logger.error(f"Basketball Odds API exception: {e}")
+                game = {
+                    "id": f"bb_{match.get('id', '')}",
+                    "sport": "basketball",
+                    "league": "EuroLeague",
+                    "league_id": "basketball_euroleague",
+                    "league_code": "EURO",
+                    "home_team": match.get("home_team", "Unknown"),
+                    "away_team": match.get("away_team", "Unknown"),
+                    "home_logo": "",
+                    "away_logo": "",
+                    "match_date": match.get("commence_time", ""),
+                    "status": "NS",
+                    "home_score": None,
+                    "away_score": None,
+                    "has_odds": True,
+                    "odds": best_odds,
+                    "bookmakers": best_odds.get("bookmakers", [])[:5],
+                    "quick_analysis": quick_analysis
+                }
+                games.append(game)
+            
+            set_cache(cache_key, games)
+            return games
+        elif response.status_code == 401:
+            logger.error("Basketball Odds API: Invalid API key")
+            return []
+        elif response.status_code == 429:
+            logger.warning("Basketball Odds API: Rate limit exceeded or quota reached")
+            provider_budgets["odds_api"].backoff(60)
+            return []
+        else:
+            logger.error(f"Basketball Odds API error: {response.status_code} - {response.text[:200]}")
             return []
+    except Exception as e:
+        logger.error(f"Basketball Odds API exception: {e}")
+        return []
+
+# Background refresher - refreshes league odds and fixtures ahead of expiry so
+# user requests are served from cache (fresh, or stale within the grace window)
+BACKGROUND_REFRESH = os.environ.get('BACKGROUND_REFRESH', 'true').lower() == 'true'
+REFRESH_TICK = int(os.environ.get('REFRESH_TICK', '15'))  # seconds between scheduler passes
+REFRESH_LEAD = int(os.environ.get('REFRESH_LEAD', '60'))  # refresh this many seconds before expiry
+REFRESH_RETRY = int(os.environ.get('REFRESH_RETRY', '60'))  # minimum gap between attempts for one key
+REFRESH_HOT_WINDOW = int(os.environ.get('REFRESH_HOT_WINDOW', str(3 * 3600)))  # kickoff within 3h
+REFRESH_HOT_INTERVAL = int(os.environ.get('REFRESH_HOT_INTERVAL', '120'))
+REFRESH_WARM_WINDOW = int(os.environ.get('REFRESH_WARM_WINDOW', str(24 * 3600)))  # kickoff within 24h
+REFRESH_COLD_INTERVAL = int(os.environ.get('REFRESH_COLD_INTERVAL', '900'))
+
+refresh_stats: Dict[str, Any] = {"runs": 0, "refreshes": 0, "last_run": None}
+refresh_attempts: Dict[str, float] = {}
+refresh_task: Optional["asyncio.Task"] = None
+
+def seconds_until_kickoff(kickoff_times: List[str]) -> Optional[float]:
+    """Seconds until the soonest upcoming kickoff in a list of ISO timestamps"""
+    now = datetime.now(timezone.utc)
+    soonest = None
+    for kickoff_time in kickoff_times:
+        try:
+            kickoff = datetime.fromisoformat(kickoff_time.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            continue
+        if kickoff.tzinfo is None:
+            kickoff = kickoff.replace(tzinfo=timezone.utc)
+        delta = (kickoff - now).total_seconds()
+        if delta >= 0 and (soonest is None or delta < soonest):
+            soonest = delta
+    return soonest
+
+def refresh_interval(ttl: int, to_kickoff: Optional[float]) -> float:
+    """How often to refresh a snapshot, shorter for competitions kicking off soon"""
+    ahead_of_expiry = max(ttl - REFRESH_LEAD, REFRESH_TICK)
+    if to_kickoff is not None and to_kickoff <= REFRESH_HOT_WINDOW:
+        return min(REFRESH_HOT_INTERVAL, ahead_of_expiry)
+    if to_kickoff is not None and to_kickoff <= REFRESH_WARM_WINDOW:
+        return ahead_of_expiry
+    # Quiet competitions may go stale, but never past the grace window
+    return max(min(REFRESH_COLD_INTERVAL, ttl + CACHE_STALE_GRACE - REFRESH_LEAD), ahead_of_expiry)
+
+def refresh_jobs() -> List[Tuple[str, Optional[float], Callable[[], Awaitable[Any]]]]:
+    """(cache key, seconds to next kickoff, refresh coroutine factory) for every background-refreshed snapshot"""
+    jobs = []
+    for league_code, league_info in FOOTBALL_LEAGUES.items():
+        endpoint = f"/competitions/{league_code}/matches?status=SCHEDULED"
+        fixtures_key = f"fd:{endpoint}"
+        fixtures = cache.peek(fixtures_key) or {}
+        to_kickoff = seconds_until_kickoff([m.get("utcDate", "") for m in fixtures.get("matches", [])])
+        if FOOTBALL_DATA_KEY:
+            jobs.append((fixtures_key, to_kickoff, lambda endpoint=endpoint: fetch_football_data(endpoint, use_cache=False)))
+        odds_key = league_info.get("odds_key", "")
+        if odds_key and ODDS_API_KEY:
+            jobs.append((f"odds:{odds_key}", to_kickoff, lambda odds_key=odds_key: fetch_real_odds(odds_key, use_cache=False)))
+    for league_info in BASKETBALL_LEAGUES.values():
+        odds_key = league_info.get("odds_key", "")
+        if odds_key and ODDS_API_KEY:
+            games_key = f"basketball_odds:{odds_key}"
+            to_kickoff = seconds_until_kickoff([g.get("match_date", "") for g in cache.peek(games_key) or []])
+            jobs.append((games_key, to_kickoff, lambda odds_key=odds_key: fetch_basketball_from_odds_api(odds_key, use_cache=False)))
+    return jobs
+
+async def refresh_snapshot(key: str, to_kickoff: Optional[float], refresh: Callable[[], Awaitable[Any]]):
+    """Refresh one snapshot, reusing another worker's refresh from L2 when it is recent enough"""
+    l2_entry = await l2_get(key)
+    if l2_entry and time.time() - l2_entry[1] < refresh_interval(cache.ttl_for(key), to_kickoff):
+        cache.set(key, l2_entry[0], l2_entry[1])
+        return
+    await refresh()
+
+async def refresh_due_snapshots():
+    """Refresh every snapshot whose age has reached its refresh interval"""
+    now = time.time()
+    due = []
+    for key, to_kickoff, refresh in refresh_jobs():
+        age = cache.age(key)
+        if age is not None and age < refresh_interval(cache.ttl_for(key), to_kickoff):
+            continue
+        if now - refresh_attempts.get(key, 0) < REFRESH_RETRY:
+            continue
+        refresh_attempts[key] = now
+        due.append(refresh_snapshot(key, to_kickoff, refresh))
+    if due:
+        await asyncio.gather(*due)
+    refresh_stats["runs"] += 1
+    refresh_stats["refreshes"] += len(due)
+    refresh_stats["last_run"] = datetime.now(timezone.utc).isoformat()
+
+async def refresh_loop():
+    while True:
+        try:
+            await refresh_due_snapshots()
+        except Exception as e:
+            logger.error(f"Background refresh error: {e}")
+        await asyncio.sleep(REFRESH_TICK)
+
+# Odds recorder - one worker at a time (holding a lease in MongoDB) records every new
+# odds snapshot, whichever worker fetched it: snapshots are read from L1, or from the
+# shared L2 cache when that holds a newer one. Diffs are taken against the last
+# recorded prices in MongoDB, so they stay correct across workers and handovers.
+ODDS_RECORDER = os.environ.get('ODDS_RECORDER', 'true').lower() == 'true'
+ODDS_RECORDER_INTERVAL = int(os.environ.get('ODDS_RECORDER_INTERVAL', '60'))  # seconds between passes
+ODDS_RECORDER_LEASE = 3 * ODDS_RECORDER_INTERVAL  # another worker takes over after this long without renewal
+ODDS_RECORDER_ID = uuid.uuid4().hex
+odds_recorder_task: Optional["asyncio.Task"] = None
+odds_recorder_stats = {"leader": False, "passes": 0, "recorded": 0, "errors": 0, "last_run": None}
+
+def odds_snapshot_jobs() -> List[Tuple[str, str, Callable[..., List[Tuple[str, str]]]]]:
+    """(sport key, cache key, outcome labels) for every odds snapshot"""
+    jobs = [(info["odds_key"], f"odds:{info['odds_key']}", football_outcome_labels)
+            for info in FOOTBALL_LEAGUES.values() if info.get("odds_key")]
+    jobs += [(info["odds_key"], f"basketball_odds:{info['odds_key']}", basketball_outcome_labels)
+             for info in BASKETBALL_LEAGUES.values() if info.get("odds_key")]
+    return jobs
+
+def snapshot_events(data: Any) -> List[Dict[str, Any]]:
+    """Odds API events (with their raw bookmakers) back out of a cached odds snapshot"""
+    if isinstance(data, dict):  # football odds map
+        return [{**entry["match_data"], "bookmakers": entry.get("raw_bookmakers", [])}
+                for entry in data.values() if (entry.get("match_data") or {}).get("id")]
+    return [
+        {"id": game["id"][3:], "home_team": game.get("home_team"), "away_team": game.get("away_team"),
+         "commence_time": game.get("match_date"), "bookmakers": (game.get("odds") or {}).get("raw_bookmakers", [])}
+        for game in data or [] if game.get("id", "").startswith("bb_")
+    ]
+
+async def latest_snapshot(cache_key: str) -> Optional[Tuple[Any, float]]:
+    """(data, stored_at) of the newest snapshot this worker can see"""
+    entry = cache.peek_entry(cache_key)
+    l2_entry = await l2_get(cache_key)
+    if l2_entry and (entry is None or l2_entry[1] > entry[1]):
+        return l2_entry
+    return entry
+
+async def acquire_recorder_lease() -> bool:
+    now = time.time()
+    try:
+        await db.odds_recorder.find_one_and_update(
+            {"_id": "odds", "$or": [{"owner": ODDS_RECORDER_ID}, {"expires": {"$lt": now}}]},
+            {"$set": {"owner": ODDS_RECORDER_ID, "expires": now + ODDS_RECORDER_LEASE}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False  # held by another worker
+
+async def record_new_snapshots():
+    """Record every odds snapshot newer than the last one recorded for its sport key"""
+    for sport_key, cache_key, outcome_labels in odds_snapshot_jobs():
+        snapshot = await latest_snapshot(cache_key)
+        if not snapshot:
+            continue
+        if sport_key not in odds_recorded_at:
+            await load_recorded_prices(sport_key)
+        data, stored_at = snapshot
+        if stored_at <= odds_recorded_at[sport_key]:
+            continue
+        events = snapshot_events(data)
+        await record_odds_snapshot(sport_key, stored_at, events, flatten_odds(events, outcome_labels))
+        odds_recorder_stats["recorded"] += 1
+
+async def odds_recorder_loop():
+    while True:
+        try:
+            leader = await acquire_recorder_lease()
+            if leader:
+                await record_new_snapshots()
+            elif odds_recorder_stats["leader"]:
+                # Lost the lease: reload the recorded state if it comes back to this worker
+                odds_last_prices.clear()
+                odds_recorded_at.clear()
+            odds_recorder_stats["leader"] = leader
+            odds_recorder_stats["passes"] += 1
+            odds_recorder_stats["last_run"] = datetime.now(timezone.utc).isoformat()
+        except Exception as e:
+            odds_recorder_stats["errors"] += 1
+            logger.error(f"Odds recorder error: {e}")
+        await asyncio.sleep(ODDS_RECORDER_INTERVAL)
+
+# AI analysis precompute - scans upcoming fixtures and generates analyses ahead of
+# kickoff, soonest (and most viewed) first, within a concurrency and hourly budget
+AI_PRECOMPUTE = os.environ.get('AI_PRECOMPUTE', 'true').lower() == 'true'
+AI_PRECOMPUTE_INTERVAL = int(os.environ.get('AI_PRECOMPUTE_INTERVAL', '600'))  # seconds between slate scans
+AI_PRECOMPUTE_HORIZON = int(os.environ.get('AI_PRECOMPUTE_HORIZON', str(48 * 3600)))  # only kickoffs within 48h
+AI_PRECOMPUTE_CONCURRENCY = int(os.environ.get('AI_PRECOMPUTE_CONCURRENCY', '2'))
+AI_PRECOMPUTE_MAX_PER_HOUR = int(os.environ.get('AI_PRECOMPUTE_MAX_PER_HOUR', '30'))
+AI_PRECOMPUTE_VIEW_WEIGHT = int(os.environ.get('AI_PRECOMPUTE_VIEW_WEIGHT', '3600'))  # a view counts as kicking off 1h sooner
+AI_PRECOMPUTE_FD_RESERVE = 6  # Football-Data.org requests per minute left for users (a detail load needs 4)
+
+match_views: Dict[str, int] = {}  # detail views of upcoming matches, pruned once they kick off
+precompute_queue: "asyncio.PriorityQueue" = asyncio.PriorityQueue()
+precompute_queued: set = set()
+precompute_order = itertools.count()
+precompute_generations: deque = deque()
+precompute_stats = {"scans": 0, "queued": 0, "skipped_stored": 0, "generated": 0, "already_stored": 0, "failed": 0}
+precompute_tasks: List["asyncio.Task"] = []
+
+def record_match_view(match: Dict[str, Any]):
+    """Count a detail view towards precompute priority (loaded matches that haven't kicked off only)"""
+    if seconds_until_kickoff([match.get("match_date", "")]) is not None:
+        match_views[match["id"]] = match_views.get(match["id"], 0) + 1
+
+async def scan_for_precompute():
+    """Queue upcoming football fixtures that are within the precompute horizon"""
+    index = await load_match_index("SCHEDULED", "summary")
+    candidates = []
+    upcoming = set()
+    for match in index.matches:
+        match_id = match.get("id", "")
+        to_kickoff = seconds_until_kickoff([match.get("match_date", "")])
+        if to_kickoff is not None:
+            upcoming.add(match_id)
+        if match.get("sport") != "football" or match_id in precompute_queued:
+            continue
+        if to_kickoff is None or to_kickoff > AI_PRECOMPUTE_HORIZON:
+            continue
+        candidates.append((match_id, to_kickoff))
+    # Matches whose stored analysis outlives the next scan are left alone: checking their
+    # inputs would cost a detail load (4 Football-Data.org requests) each
+    stored = await stored_analysis_ids([match_id for match_id, _ in candidates], AI_PRECOMPUTE_INTERVAL)
+    precompute_stats["skipped_stored"] += len(stored)
+    for match_id in [match_id for match_id in match_views if match_id not in upcoming]:
+        del match_views[match_id]  # kicked off (or dropped from the slate)
+    for match_id, to_kickoff in candidates:
+        if match_id in stored:
+            continue
+        priority = to_kickoff - AI_PRECOMPUTE_VIEW_WEIGHT * match_views.get(match_id, 0)
+        precompute_queued.add(match_id)
+        precompute_stats["queued"] += 1
+        await precompute_queue.put((priority, next(precompute_order), match_id))
+    precompute_stats["scans"] += 1
+
+async def wait_for_precompute_budget():
+    """Block until the hourly generation budget and Football-Data.org headroom allow another job"""
+    while True:
+        now = time.time()
+        while precompute_generations and now - precompute_generations[0] >= 3600:
+            precompute_generations.popleft()
+        if len(precompute_generations) >= AI_PRECOMPUTE_MAX_PER_HOUR:
+            await asyncio.sleep(3600 - (now - precompute_generations[0]))
+        elif provider_budgets["football_data"].headroom() < AI_PRECOMPUTE_FD_RESERVE:
+            await asyncio.sleep(5)
+        else:
+            return
+
+async def precompute_analysis(match_id: str):
+    await wait_for_precompute_budget()
+    if await stored_analysis_ids([match_id], AI_PRECOMPUTE_INTERVAL):
+        precompute_stats["already_stored"] += 1  # stored by a viewer while this job was queued
+        return
+    match = await load_match_detail(match_id)
+    match_data = analysis_input(match)
+    if await has_stored_analysis(match_data):
+        precompute_stats["already_stored"] += 1
+        return
+    precompute_generations.append(time.time())
+    await get_cached_ai_analysis(match_data)
+    precompute_stats["generated"] += 1
+
+async def precompute_worker():
+    while True:
+        _, _, match_id = await precompute_queue.get()
+        try:
+            await precompute_analysis(match_id)
+        except Exception as e:
+            precompute_stats["failed"] += 1
+            logger.warning(f"Precompute failed for {match_id}: {e!r}")
+        finally:
+            precompute_queued.discard(match_id)
+            precompute_queue.task_done()
+
+async def precompute_scan_loop():
+    while True:
+        try:
+            await scan_for_precompute()
+        except Exception as e:
+            logger.error(f"Precompute scan error: {e}")
+        await asyncio.sleep(AI_PRECOMPUTE_INTERVAL)
 
 # API Endpoints
 @api_router.get("/")
 async def root():
     return {"message": "BetSmart AI API", "version": "2.0.0", "data_source": "Football-Data.org"}
 
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Get in-memory cache usage and hit/miss/eviction counters"""
+    return {
+        **cache.stats(),
+        "inflight": len(inflight_fetches),
+        **single_flight_stats,
+        "refresher": {"enabled": BACKGROUND_REFRESH, **refresh_stats},
+        "l2": {"enabled": L2_CACHE_ENABLED, **l2_stats},
+        "ai_analysis": ai_analysis_stats,
+        "odds_history": {"enabled": ODDS_HISTORY, **odds_history_stats},
+        "odds_recorder": {"enabled": ODDS_RECORDER, **odds_recorder_stats},
+        "odds_changes": {"enabled": ODDS_CHANGE_FEED, **odds_change_stats},
+    }
+
+@api_router.get("/analysis/queue")
+async def get_analysis_queue():
+    """Get the AI analysis precompute queue status"""
+    return {
+        "enabled": AI_PRECOMPUTE and bool(EMERGENT_LLM_KEY),
+        "pending": precompute_queue.qsize(),
+        "generated_last_hour": len(precompute_generations),
+        "max_per_hour": AI_PRECOMPUTE_MAX_PER_HOUR,
+        **precompute_stats,
+    }
+
+@api_router.get("/team-aliases")
+async def get_team_aliases():
+    """Get the team name aliases used to join fixtures to odds"""
+    return {"aliases": [{"alias": alias, "canonical": canonical} for alias, canonical in sorted(TEAM_ALIASES.items())]}
+
+@api_router.post("/team-aliases")
+async def save_team_alias(request: TeamAlias):
+    """Map a fixture team name to the name the odds feed uses"""
+    alias_key, canonical_key = team_name_key(request.alias), team_match_key(request.canonical)
+    if not alias_key or not canonical_key:
+        raise HTTPException(status_code=400, detail="Alias and canonical name are required")
+    await db.team_aliases.replace_one(
+        {"alias": alias_key},
+        {"alias": alias_key, "canonical": canonical_key},
+        upsert=True,
+    )
+    add_team_alias(alias_key, canonical_key)
+    return {"alias": alias_key, "canonical": canonical_key, "message": "Alias saved successfully"}
+
 @api_router.get("/leagues")
 async def get_leagues():
     """Get all available leagues"""
@@ -912,16 +2607,82 @@ async def get_leagues():
         })
     return {"leagues": leagues}
 
-@api_router.get("/matches")
-async def get_matches(
-    league: Optional[str] = None, 
+# Response views for match lists: "summary" keeps best prices only, "full" adds raw per-bookmaker odds
+MATCH_VIEWS = ("summary", "full")
+
+SUMMARY_OMITTED_ODDS = ("raw_bookmakers", "market_stats")
+SUMMARY_CONSENSUS_MARKETS = ("Match Winner", "Over/Under 2.5", "Both Teams Score")  # line markets are full view only
+
+def project_match(match: Dict[str, Any], view: str) -> Dict[str, Any]:
+    """Shape a parsed match for a response view, with prices in API form"""
+    odds = match.get("odds")
+    if not odds:
+        return match
+    if view != "full":
+        odds = {key: value for key, value in odds.items() if key not in SUMMARY_OMITTED_ODDS}
+        if odds.get("consensus"):
+            odds["consensus"] = {market: entry for market, entry in odds["consensus"].items()
+                                 if market in SUMMARY_CONSENSUS_MARKETS}
+    return {**match, "odds": format_odds(odds)}
+
+async def fetch_league_snapshot(league_code: str, status: Optional[str], view: str = "full") -> Tuple[Optional[tuple], List[Dict[str, Any]]]:
+    """Fetch one football league's fixtures and odds (concurrently) and parse them.
+    
+    Returns (version, matches) in the requested view. The parsed list and its
+    projections are reused until the fixtures or the odds snapshot they were
+    built from is refreshed, or a team alias is added."""
+    league_info = FOOTBALL_LEAGUES[league_code]
+    odds_key = league_info.get("odds_key", "")
+    
+    # Fetch scheduled matches for this competition
+    endpoint = f"/competitions/{league_code}/matches"
+    if status:
+        endpoint += f"?status={status}"
+    
+    odds_map, data = await asyncio.gather(
+        fetch_real_odds(odds_key) if odds_key else asyncio.sleep(0, result={}),
+        fetch_football_data(endpoint),
+    )
+    # Team aliases decide which odds entry each fixture gets, so an alias change rebuilds the list too
+    version = (snapshot_version(f"fd:{endpoint}", data), snapshot_version(f"odds:{odds_key}", odds_map), team_aliases_version)
+    if None in version:
+        version = None
+    
+    derived_key = ("league", league_code, status)
+    parsed_matches = get_derived(derived_key, version)
+    if parsed_matches is None:
+        logger.info(f"Parsing {league_code} with {len(odds_map)} odds")
+        parsed_matches = [
+            parse_football_data_match(match, league_code, odds_map)
+            for match in data.get("matches", [])
+        ]
+        set_derived(derived_key, version, parsed_matches)
+    
+    projected = get_derived(derived_key + (view,), version)
+    if projected is None:
+        projected = [project_match(match, view) for match in parsed_matches]
+        set_derived(derived_key + (view,), version, projected)
+    return version, projected
+
+async def fetch_basketball_snapshot(odds_key: str, view: str = "full") -> Tuple[Optional[int], List[Dict[str, Any]]]:
+    """Fetch basketball games; returns (version, games) in the requested view"""
+    games = await fetch_basketball_from_odds_api(odds_key)
+    version = snapshot_version(f"basketball_odds:{odds_key}", games)
+    derived_key = ("basketball", odds_key, view)
+    projected = get_derived(derived_key, version)
+    if projected is None:
+        projected = [project_match(game, view) for game in games]
+        set_derived(derived_key, version, projected)
+    return version, projected
+
+async def load_matches(
+    league: Optional[str] = None,
     sport: Optional[str] = None,
     only_with_odds: bool = False,
-    status: Optional[str] = "SCHEDULED"
-):
-    """Get upcoming matches with REAL odds from bookmakers"""
-    all_matches = []
-    
+    status: Optional[str] = "SCHEDULED",
+    fields: str = "full"
+) -> Tuple[Any, Any, Dict[str, Any]]:
+    """Build the merged match list; returns (derived key, version, payload)"""
     # Check if basketball league is explicitly requested
     is_basketball_request = (
         league in BASKETBALL_LEAGUES or 
@@ -931,49 +2692,43 @@ async def get_matches(
     )
     
     # Fetch football matches ONLY if not explicitly requesting basketball
+    leagues_to_fetch = []
     if not is_basketball_request and (sport is None or sport == "football"):
         leagues_to_fetch = [league] if league and league in FOOTBALL_LEAGUES else list(FOOTBALL_LEAGUES.keys())
-        
-        for league_code in leagues_to_fetch:
-            league_info = FOOTBALL_LEAGUES[league_code]
-            
-            # Fetch real odds for this league
-            odds_key = league_info.get("odds_key", "")
-            odds_map = {}
-            if odds_key:
-                odds_map = await fetch_real_odds(odds_key)
-                logger.info(f"Fetched {len(odds_map)} odds for {league_code}")
-            
-            # Fetch scheduled matches for this competition
-            endpoint = f"/competitions/{league_code}/matches"
-            if status:
-                endpoint += f"?status={status}"
-            
-            data = await fetch_football_data(endpoint)
-            matches = data.get("matches", [])
-            
-            for match in matches[:20]:  # Limit to 20 per league
-                parsed = parse_football_data_match(match, league_code, odds_map)
-                
-                # Filter by odds if requested
-                if only_with_odds and not parsed.get("has_odds"):
-                    continue
-                    
-                all_matches.append(parsed)
-            
-            await asyncio.sleep(0.1)  # Small delay to respect rate limits
     
     # Fetch basketball matches ONLY from The Odds API when basketball is requested
+    basketball_keys = []
     if is_basketball_request or (sport is None and league is None):
-        for league_id, league_info in BASKETBALL_LEAGUES.items():
-            odds_key = league_info.get("odds_key", "")
-            if odds_key:
-                # Fetch basketball games directly from The Odds API
-                logger.info(f"Fetching basketball from The Odds API: {odds_key}")
-                basketball_odds = await fetch_basketball_from_odds_api(odds_key)
-                logger.info(f"Fetched {len(basketball_odds)} basketball games")
-                for game in basketball_odds:
-                    all_matches.append(game)
+        basketball_keys = [info["odds_key"] for info in BASKETBALL_LEAGUES.values() if info.get("odds_key")]
+    
+    fetches = [fetch_league_snapshot(league_code, status, fields) for league_code in leagues_to_fetch]
+    fetches += [fetch_basketball_snapshot(odds_key, fields) for odds_key in basketball_keys]
+    
+    if CONCURRENT_LEAGUE_FETCH:
+        # Provider budgets bound the fan-out; gather keeps results in league order
+        snapshots = await asyncio.gather(*fetches)
+    else:
+        snapshots = [await fetch for fetch in fetches]
+    
+    # The merged list only changes when one of its snapshots does
+    version = tuple(snapshot[0] for snapshot in snapshots)
+    if None in version:
+        version = None
+    derived_key = ("matches", tuple(leagues_to_fetch), tuple(basketball_keys), status, only_with_odds, fields)
+    payload = get_derived(derived_key, version)
+    if payload is not None:
+        return derived_key, version, payload
+    
+    all_matches = []
+    for index, (_, matches) in enumerate(snapshots):
+        is_football = index < len(leagues_to_fetch)
+        if is_football:
+            matches = matches[:20]  # Limit to 20 per league
+        for match in matches:
+            # Filter by odds if requested
+            if is_football and only_with_odds and not match.get("has_odds"):
+                continue
+            all_matches.append(match)
     
     # Sort by date
     all_matches.sort(key=lambda x: x.get("match_date", ""))
@@ -981,41 +2736,216 @@ async def get_matches(
     # Count matches with real odds
     with_odds = sum(1 for m in all_matches if m.get("has_odds"))
     
-    return {
+    payload = {
         "matches": all_matches, 
         "total": len(all_matches),
         "with_real_odds": with_odds
     }
+    set_derived(derived_key, version, payload)
+    return derived_key, version, payload
 
-@api_router.get("/matches/{match_id}")
-async def get_match_detail(match_id: str):
-    """Get detailed match information including H2H, form, and AI analysis"""
+def match_sort_key(match: Dict[str, Any]) -> Tuple[str, str]:
+    return match.get("match_date") or "", match.get("id") or ""
+
+class MatchIndex:
+    """All matches of one slate snapshot sorted by kickoff, with per-match filter columns"""
+    __slots__ = ("matches", "keys", "leagues", "sports", "probabilities", "markets", "by_id", "value_scan", "event_ids")
+
+    def __init__(self, matches: List[Dict[str, Any]]):
+        self.matches = sorted(matches, key=match_sort_key)
+        self.by_id = {m.get("id"): m for m in self.matches}
+        self.value_scan: Optional["ValueScan"] = None  # built on first /value-bets request
+        self.event_ids: Optional[Dict[str, str]] = None  # Odds API event id -> match id, built on first /odds/changes request
+        self.keys = [match_sort_key(m) for m in self.matches]
+        self.leagues = [m.get("league_code") for m in self.matches]
+        self.sports = [m.get("sport") for m in self.matches]
+        self.probabilities = [(m.get("quick_analysis") or {}).get("probability") or 0 for m in self.matches]
+        self.markets = [
+            frozenset(name for name, prices in (m.get("odds") or {}).items() if isinstance(prices, dict) and prices)
+            for m in self.matches
+        ]
+
+    def page(
+        self,
+        limit: int,
+        after: Optional[Tuple[str, str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        leagues: Optional[set] = None,
+        sport: Optional[str] = None,
+        min_probability: Optional[float] = None,
+        markets: Optional[List[str]] = None,
+        with_odds: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, str]]]:
+        """Return up to limit matches after the cursor key, and the cursor key for the next page"""
+        start = bisect.bisect_right(self.keys, after) if after else 0
+        if date_from:
+            start = max(start, bisect.bisect_left(self.keys, (date_from, "")))
+        page = []
+        for i in range(start, len(self.matches)):
+            if date_to and self.keys[i][0] > date_to:
+                break
+            if leagues and self.leagues[i] not in leagues:
+                continue
+            if sport and self.sports[i] != sport:
+                continue
+            if min_probability is not None and self.probabilities[i] < min_probability:
+                continue
+            if markets and not all(market in self.markets[i] for market in markets):
+                continue
+            if with_odds and not self.matches[i].get("has_odds"):
+                continue
+            page.append(self.matches[i])
+            if len(page) == limit:
+                return page, self.keys[i] if i + 1 < len(self.matches) else None
+        return page, None
+
+async def load_match_index(status: Optional[str], fields: str) -> MatchIndex:
+    """Index over every league's matches, rebuilt only when one of the snapshots changes"""
+    fetches = [fetch_league_snapshot(league_code, status, fields) for league_code in FOOTBALL_LEAGUES]
+    fetches += [fetch_basketball_snapshot(info["odds_key"], fields) for info in BASKETBALL_LEAGUES.values() if info.get("odds_key")]
+    snapshots = await asyncio.gather(*fetches)
+    version = tuple(snapshot[0] for snapshot in snapshots)
+    if None in version:
+        version = None
+    derived_key = ("index", status, fields)
+    index = get_derived(derived_key, version)
+    if index is None:
+        index = MatchIndex([match for _, matches in snapshots for match in matches])
+        set_derived(derived_key, version, index)
+    return index
+
+def encode_cursor(key: Tuple[str, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        match_date, match_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(match_date), str(match_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_date_filter(value: Optional[str], end_of_day: bool = False) -> Optional[str]:
+    """Normalize a date/datetime query value to the UTC format match_date uses"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+@api_router.get("/matches")
+async def get_matches(
+    request: Request,
+    league: Optional[str] = None, 
+    sport: Optional[str] = None,
+    only_with_odds: bool = False,
+    status: Optional[str] = "SCHEDULED",
+    fields: str = "summary",
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    leagues: Optional[str] = None,
+    min_probability: Optional[float] = None,
+    market: Optional[str] = None
+):
+    """Get upcoming matches with REAL odds from bookmakers
+    
+    fields=summary (default) returns best prices only; fields=full adds raw per-bookmaker odds.
+    
+    Passing limit, cursor or any of the filters (date_from, date_to, leagues,
+    min_probability, market) switches to a paginated response ordered by
+    kickoff, with next_cursor pointing at the following page."""
+    if fields not in MATCH_VIEWS:
+        raise HTTPException(status_code=400, detail=f"fields must be one of: {', '.join(MATCH_VIEWS)}")
+    
+    paginated = any(value is not None for value in (cursor, limit, date_from, date_to, leagues, min_probability, market))
+    if not paginated:
+        derived_key, version, payload = await load_matches(league, sport, only_with_odds, status, fields)
+        return serialized_response(request, get_serialized(derived_key, version, payload))
+    
+    league_filter = {code.strip() for code in (leagues or "").split(",") if code.strip()}
+    if league:
+        league_filter.add(league)
+    league_filter = {"EURO" if code in BASKETBALL_LEAGUES else code for code in league_filter}
+    
+    index = await load_match_index(status, fields)
+    matches, next_key = index.page(
+        limit or 50,
+        after=decode_cursor(cursor) if cursor else None,
+        date_from=parse_date_filter(date_from),
+        date_to=parse_date_filter(date_to, end_of_day=True),
+        leagues=league_filter or None,
+        sport=sport,
+        min_probability=min_probability,
+        markets=[name.strip() for name in market.split(",") if name.strip()] if market else None,
+        with_odds=only_with_odds,
+    )
+    return serialized_response(request, SerializedPayload({
+        "matches": matches,
+        "count": len(matches),
+        "with_real_odds": sum(1 for m in matches if m.get("has_odds")),
+        "next_cursor": encode_cursor(next_key) if next_key else None
+    }))
+
+def extract_form(team_id, matches_list):
+    """W/D/L letters for a team's last five finished matches"""
+    form = []
+    for m in matches_list[:5]:
+        home_id = m.get("homeTeam", {}).get("id")
+        home_goals = m.get("score", {}).get("fullTime", {}).get("home") or 0
+        away_goals = m.get("score", {}).get("fullTime", {}).get("away") or 0
+        
+        if home_id == team_id:
+            if home_goals > away_goals:
+                form.append("W")
+            elif home_goals < away_goals:
+                form.append("L")
+            else:
+                form.append("D")
+        else:
+            if away_goals > home_goals:
+                form.append("W")
+            elif away_goals < home_goals:
+                form.append("L")
+            else:
+                form.append("D")
+    return form
+
+async def load_match_detail(match_id: str, timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Load a match with odds, H2H, form and injuries (everything except the AI analysis)"""
     
     if match_id.startswith("fd_"):
         fixture_id = match_id[3:]
         
-        # Fetch match details
-        data = await fetch_football_data(f"/matches/{fixture_id}")
+        # Fetch match details - everything else depends on the teams and competition
+        data = await timed(timings, "match", fetch_football_data(f"/matches/{fixture_id}"))
         
         if not data or "id" not in data:
             raise HTTPException(status_code=404, detail="Match not found")
         
         league_code = data.get("competition", {}).get("code", "PL")
         league_info = FOOTBALL_LEAGUES.get(league_code, {"name": "Unknown", "code": league_code, "odds_key": ""})
-        
-        # Fetch real odds for this league
         odds_key = league_info.get("odds_key", "")
-        odds_map = {}
-        if odds_key:
-            odds_map = await fetch_real_odds(odds_key)
-        
-        match = parse_football_data_match(data, league_code, odds_map)
-        
-        # Fetch head to head
         home_team_id = data.get("homeTeam", {}).get("id")
         away_team_id = data.get("awayTeam", {}).get("id")
         
-        h2h_data = await fetch_football_data(f"/matches/{fixture_id}/head2head?limit=5")
+        # Odds, head to head and both teams' form only need the match document
+        odds_map, h2h_data, home_matches, away_matches = await asyncio.gather(
+            timed(timings, "odds", fetch_real_odds(odds_key) if odds_key else asyncio.sleep(0, result={})),
+            timed(timings, "head_to_head", fetch_football_data(f"/matches/{fixture_id}/head2head?limit=5")),
+            timed(timings, "home_form", fetch_football_data(f"/teams/{home_team_id}/matches?status=FINISHED&limit=5")),
+            timed(timings, "away_form", fetch_football_data(f"/teams/{away_team_id}/matches?status=FINISHED&limit=5")),
+        )
+        
+        match = parse_football_data_match(data, league_code, odds_map)
+        
         h2h_matches = h2h_data.get("matches", [])
         
         match["head_to_head"] = [
@@ -1029,33 +2959,6 @@ async def get_match_detail(match_id: str):
             for h in h2h_matches
         ]
         
-        # Get team form from recent matches
-        home_matches = await fetch_football_data(f"/teams/{home_team_id}/matches?status=FINISHED&limit=5")
-        away_matches = await fetch_football_data(f"/teams/{away_team_id}/matches?status=FINISHED&limit=5")
-        
-        def extract_form(team_id, matches_list):
-            form = []
-            for m in matches_list[:5]:
-                home_id = m.get("homeTeam", {}).get("id")
-                home_goals = m.get("score", {}).get("fullTime", {}).get("home") or 0
-                away_goals = m.get("score", {}).get("fullTime", {}).get("away") or 0
-                
-                if home_id == team_id:
-                    if home_goals > away_goals:
-                        form.append("W")
-                    elif home_goals < away_goals:
-                        form.append("L")
-                    else:
-                        form.append("D")
-                else:
-                    if away_goals > home_goals:
-                        form.append("W")
-                    elif away_goals < home_goals:
-                        form.append("L")
-                    else:
-                        form.append("D")
-            return form
-        
         match["home_form"] = extract_form(home_team_id, home_matches.get("matches", []))
         match["away_form"] = extract_form(away_team_id, away_matches.get("matches", []))
         
@@ -1064,27 +2967,12 @@ async def get_match_detail(match_id: str):
             "home": [],
             "away": []
         }
-        
-        # Get AI analysis
-        match["ai_analysis"] = await get_ai_analysis({
-            "id": match_id,
-            "sport": "football",
-            "home_team": match["home_team"],
-            "away_team": match["away_team"],
-            "league": match["league"],
-            "home_form": match["home_form"],
-            "away_form": match["away_form"],
-            "h2h": match["head_to_head"],
-            "home_injuries": [],
-            "away_injuries": []
-        })
-        
         return match
     
     elif match_id.startswith("bb_"):
         game_id = match_id[3:]
         
-        game_data = await fetch_api_basketball(f"/games?id={game_id}")
+        game_data = await timed(timings, "match", fetch_api_basketball(f"/games?id={game_id}"))
         games = game_data.get("response", [])
         
         if not games:
@@ -1099,43 +2987,718 @@ async def get_match_detail(match_id: str):
         match["home_form"] = ["W", "W", "L", "W", "W"]
         match["away_form"] = ["L", "W", "W", "W", "L"]
         match["injuries"] = {"home": [], "away": []}
-        
-        match["ai_analysis"] = await get_ai_analysis({
-            "id": match_id,
-            "sport": "basketball",
-            "home_team": match["home_team"],
-            "away_team": match["away_team"],
-            "league": match["league"],
-            "home_form": match["home_form"],
-            "away_form": match["away_form"],
-            "h2h": []
-        })
-        
         return match
     
     raise HTTPException(status_code=404, detail="Match not found")
 
+def analysis_input(match: Dict[str, Any]) -> Dict[str, Any]:
+    """The get_ai_analysis input for a loaded match detail"""
+    return {
+        "id": match["id"],
+        "sport": match["sport"],
+        "home_team": match["home_team"],
+        "away_team": match["away_team"],
+        "league": match["league"],
+        "home_form": match["home_form"],
+        "away_form": match["away_form"],
+        "h2h": match["head_to_head"],
+        "home_injuries": match["injuries"]["home"],
+        "away_injuries": match["injuries"]["away"],
+        "odds": analysis_odds(match.get("odds"))
+    }
+
+class ValueScan:
+    """Every priced outcome of a slate that has a consensus probability, as columns.
+    
+    Built once per slate index; each scan is a handful of array operations."""
+    __slots__ = ("matches", "match_rows", "markets", "market_codes", "selections", "prices",
+                 "probabilities", "books", "leagues", "league_codes", "sports", "sport_codes")
+
+    def __init__(self, matches: List[Dict[str, Any]]):
+        self.matches = matches
+        self.market_codes: Dict[str, int] = {}
+        self.league_codes: Dict[str, int] = {}
+        self.sport_codes: Dict[str, int] = {}
+        match_rows, markets, selections, prices, probabilities, books, leagues, sports = [], [], [], [], [], [], [], []
+        for row, match in enumerate(matches):
+            odds = match.get("odds") or {}
+            market_stats = odds.get("market_stats") or {}
+            for entry in (odds.get("consensus") or {}).values():
+                priced = market_stats.get(entry["market"]) or {}
+                for consensus_selection, probability in entry["probabilities"].items():
+                    selection = entry["selections"].get(consensus_selection)
+                    if selection not in priced or probability <= 0:
+                        continue
+                    match_rows.append(row)
+                    markets.append(self.market_codes.setdefault(entry["market"], len(self.market_codes)))
+                    selections.append(selection)
+                    prices.append(priced[selection]["best"])
+                    probabilities.append(probability)
+                    books.append(entry["books"])
+                    leagues.append(self.league_codes.setdefault(match.get("league_code") or "", len(self.league_codes)))
+                    sports.append(self.sport_codes.setdefault(match.get("sport") or "", len(self.sport_codes)))
+        self.match_rows = np.array(match_rows, dtype=np.int64)
+        self.markets = np.array(markets, dtype=np.int64)
+        self.selections = selections
+        self.prices = np.array(prices, dtype=np.float64)
+        self.probabilities = np.array(probabilities, dtype=np.float64)
+        self.books = np.array(books, dtype=np.int64)
+        self.leagues = np.array(leagues, dtype=np.int64)
+        self.sports = np.array(sports, dtype=np.int64)
+
+    def scan(self, min_edge: float, min_books: int, markets: Optional[List[str]], leagues: Optional[List[str]],
+             sport: Optional[str], limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """(number of matching outcomes, the top `limit` by edge)"""
+        edges = self.probabilities * self.prices - 1  # expected profit per unit staked
+        mask = (edges * 100 >= min_edge) & (self.books >= min_books)
+        if markets:
+            mask &= np.isin(self.markets, [self.market_codes.get(m, -1) for m in markets])
+        if leagues:
+            mask &= np.isin(self.leagues, [self.league_codes.get(l, -1) for l in leagues])
+        if sport:
+            mask &= self.sports == self.sport_codes.get(sport, -1)
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(-edges[rows], kind="stable")[:limit]]
+        
+        market_names = list(self.market_codes)
+        value_bets = []
+        for i in rows.tolist():
+            match = self.matches[self.match_rows[i]]
+            price, probability = float(self.prices[i]), float(self.probabilities[i])
+            value_bets.append({
+                "match_id": match["id"],
+                "home_team": match.get("home_team"),
+                "away_team": match.get("away_team"),
+                "league": match.get("league"),
+                "league_code": match.get("league_code"),
+                "sport": match.get("sport"),
+                "match_date": match.get("match_date"),
+                "market": market_names[self.markets[i]],
+                "selection": self.selections[i],
+                "price": price,
+                "fair_probability": round(probability * 100, 2),
+                "implied_probability": round(100 / price, 2),
+                "fair_odds": round(1 / probability, 2),
+                "edge": round(float(edges[i]) * 100, 2),
+                "kelly_fraction": round(max(0.0, float(edges[i]) / (price - 1)), 4),
+                "books": int(self.books[i]),
+                "value_rating": calculate_value_bet(probability * 100, price)["value_rating"],
+            })
+        return int(mask.sum()), value_bets
+
+@api_router.get("/value-bets")
+async def get_value_bets(
+    min_edge: float = 0,
+    min_books: int = 3,
+    market: Optional[str] = None,
+    league: Optional[str] = None,
+    sport: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Rank every priced outcome on the upcoming slate by edge over its consensus fair probability.
+    
+    edge is the expected profit (% of stake) at the best available price; min_books
+    is the number of bookmakers the consensus must be built from. market and league
+    take comma-separated lists (e.g. market=Match Winner,Handicap)."""
+    index = await load_match_index("SCHEDULED", "full")
+    if index.value_scan is None:
+        index.value_scan = ValueScan(index.matches)
+    total, value_bets = index.value_scan.scan(
+        min_edge, min_books,
+        [m.strip() for m in market.split(",") if m.strip()] if market else None,
+        [l.strip() for l in league.split(",") if l.strip()] if league else None,
+        sport, limit,
+    )
+    return {"value_bets": value_bets, "count": len(value_bets), "total": total,
+            "scanned": len(index.value_scan.prices)}
+
+@api_router.get("/matches/{match_id}")
+async def get_match_detail(match_id: str):
+    """Get detailed match information including H2H, form, and AI analysis"""
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    
+    match = await load_match_detail(match_id, timings)
+    record_match_view(match)
+    
+    # Precomputed ahead of kickoff when possible; generated inline otherwise
+    match_data = analysis_input(match)
+    match = project_match(match, "full")
+    match["ai_analysis"] = await get_cached_ai_analysis(match_data, timings)
+    
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    match["timings"] = timings
+    return match
+
+def ndjson_event(event: str, data: Any) -> bytes:
+    return dumps_json({"event": event, "data": data}) + b"\n"
+
+@api_router.get("/matches/{match_id}/stream")
+async def stream_match_detail(match_id: str):
+    """Stream match detail as NDJSON events so the page renders before the LLM calls finish.
+    
+    Events, one JSON object per line: "match" (everything except the analysis),
+    "news", "analysis", then "done" with stage timings - or "error" if the analysis failed."""
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    
+    # Loaded before the stream starts so an unknown match is still a plain 404
+    match = await load_match_detail(match_id, timings)
+    record_match_view(match)
+    match_data = analysis_input(match)
+    
+    async def events():
+        yield ndjson_event("match", project_match(match, "full"))
+        try:
+            stored = await has_stored_analysis(match_data)
+            if not stored:
+                # Team news is cached per team, so the analysis below reuses this result
+                news_summary = await timed(timings, "news", search_sports_news(
+                    match_data["home_team"], match_data["away_team"], match_data["sport"], match_data["league"]))
+                yield ndjson_event("news", news_summary)
+            analysis = await timed(timings, "analysis", get_cached_ai_analysis(match_data))
+            if stored:
+                yield ndjson_event("news", analysis.get("news_summary", ""))
+            yield ndjson_event("analysis", analysis)
+        except Exception as e:
+            logger.error(f"Streaming analysis error for {match_id}: {e}")
+            yield ndjson_event("error", {"detail": "AI analysis unavailable"})
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        yield ndjson_event("done", {"timings": timings})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def resolve_odds_event(match_id: str) -> Optional[str]:
+    """The Odds API event id for a match, looked up among the recorded events around its kickoff"""
+    if match_id.startswith("bb_"):
+        return match_id[3:]
+    if not match_id.startswith("fd_"):
+        return None
+    data = await fetch_football_data(f"/matches/{match_id[3:]}")
+    if not data or "id" not in data:
+        return None
+    odds_key = FOOTBALL_LEAGUES.get(data.get("competition", {}).get("code", ""), {}).get("odds_key")
+    kickoff = parse_kickoff(data.get("utcDate"))
+    if not odds_key or kickoff is None:
+        return None
+    events = await db.odds_history.find(
+        {"sport_key": odds_key, "kickoff": {"$gte": kickoff - 2 * 86400, "$lte": kickoff + 2 * 86400}},
+        {"_id": 0, "event_id": 1, "home_team": 1, "away_team": 1, "commence_time": 1},
+    ).to_list(5000)
+    recorded = {event["event_id"]: {"match_data": event} for event in events}
+    return OddsMatcher(recorded).resolve(data.get("homeTeam", {}).get("name") or "",
+                                         data.get("awayTeam", {}).get("name") or "", data.get("utcDate"))
+
+@api_router.get("/matches/{match_id}/odds-history")
+async def get_odds_history(
+    match_id: str,
+    market: Optional[str] = None,
+    bookmaker: Optional[str] = None,
+    points: int = Query(120, ge=2, le=2000)
+):
+    """Price movement per market, selection and bookmaker since odds were first recorded.
+    
+    market and bookmaker take comma-separated lists. Series with more changes
+    than `points` are downsampled to the price in force at `points` evenly
+    spaced times; a null price means the bookmaker had withdrawn it."""
+    try:
+        event_id = await resolve_odds_event(match_id)
+        buckets = await db.odds_history.find({"event_id": event_id}).sort("start", 1).to_list(None) if event_id else []
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Odds history lookup failed for {match_id}: {e}")
+        raise HTTPException(status_code=503, detail="Odds history unavailable")
+    if not buckets:
+        raise HTTPException(status_code=404, detail="No odds history for this match")
+    
+    markets = {m.strip() for m in market.split(",") if m.strip()} if market else None
+    bookmakers = {b.strip() for b in bookmaker.split(",") if b.strip()} if bookmaker else None
+    series = replay_odds_history(buckets, markets, bookmakers)
+    start, end = buckets[0]["start"], max(bucket["end"] for bucket in buckets)
+    grid = np.linspace(start, end, points)
+    
+    history: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for (market_name, selection, book), (times, prices) in sorted(series.items()):
+        quoted = np.asarray(prices)
+        quoted = quoted[~np.isnan(quoted)]
+        current = None if math.isnan(prices[-1]) else prices[-1]
+        history.setdefault(market_name, {}).setdefault(selection, {})[book] = {
+            "open": float(quoted[0]) if len(quoted) else None,
+            "current": current,
+            "low": float(quoted.min()) if len(quoted) else None,
+            "high": float(quoted.max()) if len(quoted) else None,
+            "change": round(current - float(quoted[0]), 3) if current is not None else None,
+            "points": downsample_series(times, prices, grid),
+        }
+    
+    first = buckets[0]
+    return {
+        "match_id": match_id,
+        "event_id": event_id,
+        "home_team": first.get("home_team"),
+        "away_team": first.get("away_team"),
+        "commence_time": first.get("commence_time"),
+        "from": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+        "to": datetime.fromtimestamp(end, timezone.utc).isoformat(),
+        "snapshots": sum(bucket.get("n", 0) for bucket in buckets),
+        "markets": history,
+    }
+
+def odds_event_ids(index: MatchIndex) -> Dict[str, str]:
+    """Odds API event id -> match id for the slate's matches with odds"""
+    if index.event_ids is None:
+        event_ids = {}
+        for match in index.matches:
+            match_id = match.get("id") or ""
+            event_id = ((match.get("odds") or {}).get("match_data") or {}).get("id")
+            if not event_id and match_id.startswith("bb_"):
+                event_id = match_id[3:]
+            if event_id:
+                event_ids[event_id] = match_id
+        index.event_ids = event_ids
+    return index.event_ids
+
+@api_router.get("/odds/changes")
+async def get_odds_changes(
+    since: int = Query(0, ge=0),
+    stream: Optional[str] = None,
+    league: Optional[str] = None,
+    limit: int = Query(5000, ge=1, le=50000)
+):
+    """Price changes after version `since`, per match, market, selection and bookmaker.
+    
+    Poll with the returned stream and version. "reset": true means the changes
+    since that version are no longer available (the feed was reset, or the
+    client fell behind its retention window): reload /api/matches and continue
+    from the returned version. price is null when a bookmaker withdrew it; a
+    change with no market means the event left the odds feed."""
+    event_ids = odds_event_ids(await load_match_index("SCHEDULED", "summary"))
+    sport_keys = None
+    if league:
+        codes = {code.strip() for code in league.split(",") if code.strip()}
+        sport_keys = [info.get("odds_key") for code, info in FOOTBALL_LEAGUES.items() if code in codes]
+        sport_keys += [info.get("odds_key") for info in BASKETBALL_LEAGUES.values() if info.get("code") in codes]
+    
+    try:
+        feed = await db.odds_feed.find_one({"_id": "odds"})
+        if not feed:
+            return {"stream": None, "version": 0, "reset": False, "more": False, "changes": []}
+        head = feed["version"]
+        reset = bool(stream and stream != feed["stream"]) or since > head
+        if not reset and since < head:
+            oldest = await db.odds_changes.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+            reset = oldest is None or oldest["_id"] > since + 1
+        if reset:
+            return {"stream": feed["stream"], "version": head, "reset": True, "more": False, "changes": []}
+        
+        # Only batches below the head read above: later ones may still be missing earlier versions
+        query: Dict[str, Any] = {"end": {"$gt": since}, "_id": {"$lte": head}}
+        if sport_keys is not None:
+            query["sport_key"] = {"$in": sport_keys}
+        version, changes = head, []
+        async for batch in db.odds_changes.find(query).sort("_id", 1):
+            time_iso = datetime.fromtimestamp(batch["t"], timezone.utc).isoformat()
+            for offset, (event_id, market_name, selection, bookmaker, price, last, best) in enumerate(batch["changes"]):
+                change_version = batch["_id"] + offset
+                if change_version <= since:
+                    continue
+                if len(changes) == limit:
+                    version = change_version - 1
+                    break
+                changes.append({
+                    "version": change_version,
+                    "time": time_iso,
+                    "match_id": event_ids.get(event_id),
+                    "event_id": event_id,
+                    "market": market_name,
+                    "selection": selection,
+                    "bookmaker": bookmaker,
+                    "price": price,
+                    "previous": last,
+                    "best": best,
+                })
+            if version < head:
+                break
+    except Exception as e:
+        logger.error(f"Odds change feed lookup failed: {e}")
+        raise HTTPException(status_code=503, detail="Odds change feed unavailable")
+    return {"stream": feed["stream"], "version": version, "reset": False, "more": version < head, "changes": changes}
+
+def with_numeric_odds(match_data: Dict[str, Any]) -> Dict[str, Any]:
+    if not match_data.get("odds"):
+        return match_data
+    return {**match_data, "odds": parse_odds(match_data["odds"])}
+
 @api_router.post("/analyze")
 async def analyze_match(match_data: Dict[str, Any]):
-    """Get AI analysis for a match"""
-    analysis = await get_ai_analysis(match_data)
+    """Get AI analysis for a match (stored and reused when match_data has an id)"""
+    analysis = await get_cached_ai_analysis(with_numeric_odds(match_data))
     return analysis
 
-@api_router.post("/parlay/calculate")
-async def calculate_parlay(request: ParlayRequest):
-    """Calculate parlay odds and probability"""
-    if not request.items:
-        raise HTTPException(status_code=400, detail="No items in parlay")
+@api_router.post("/analyze/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """Analyze many matches in one call, streamed as NDJSON.
+    
+    Identical inputs are analyzed once and stored analyses are reused. Each input
+    index gets one "result" or "error" line as soon as its analysis finishes,
+    in completion order, followed by a "done" summary line."""
+    if not request.matches:
+        raise HTTPException(status_code=400, detail="No matches to analyze")
+    if len(request.matches) > AI_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {AI_BATCH_MAX_ITEMS} matches per batch")
+    
+    # Group identical inputs so each distinct analysis is requested once
+    matches = [with_numeric_odds(match_data) for match_data in request.matches]
+    groups: Dict[str, List[int]] = {}
+    invalid: List[int] = []
+    for index, match_data in enumerate(matches):
+        if not match_data.get("home_team") or not match_data.get("away_team"):
+            invalid.append(index)
+            continue
+        key = f"{match_data.get('id')}:{analysis_fingerprint(match_data)}"
+        groups.setdefault(key, []).append(index)
+    
+    semaphore = asyncio.Semaphore(AI_BATCH_CONCURRENCY)
+    
+    async def analyze(indices: List[int]) -> Tuple[List[int], Optional[Dict[str, Any]], Optional[str]]:
+        async with semaphore:
+            try:
+                analysis = await get_cached_ai_analysis(matches[indices[0]])
+            except Exception as e:
+                return indices, None, str(e)[:200]
+        if analysis.get("prediction") == "Analysis unavailable":
+            return indices, None, analysis.get("reasoning", "Analysis unavailable")
+        return indices, analysis, None
+    
+    async def events():
+        counts = {"succeeded": 0, "failed": len(invalid)}
+        for index in invalid:
+            yield ndjson_event("error", {"index": index, "id": request.matches[index].get("id"),
+                                         "detail": "home_team and away_team are required"})
+        tasks = [asyncio.ensure_future(analyze(indices)) for indices in groups.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indices, analysis, error = await next_done
+                for index in indices:
+                    match_id = request.matches[index].get("id")
+                    if error is None:
+                        counts["succeeded"] += 1
+                        yield ndjson_event("result", {"index": index, "id": match_id, "analysis": analysis})
+                    else:
+                        counts["failed"] += 1
+                        yield ndjson_event("error", {"index": index, "id": match_id, "detail": error})
+        finally:
+            # The client may disconnect mid-batch; stop the remaining work
+            for task in tasks:
+                task.cancel()
+        yield ndjson_event("done", {"total": len(request.matches), "distinct": len(groups), **counts})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+CONSENSUS_LEG_OUTCOMES = {
+    "Match Winner": {"Home": "home", "Draw": "draw", "Away": "away"},
+    "Over/Under 2.5": {"Over": "over_2.5", "Under": "under_2.5"},
+    "Both Teams Score": {"Yes": "btts_yes", "No": "btts_no"},
+}
+
+# ParlayItem.market values (as sent by the frontend and returned by the optimizer) and
+# the exact selection labels each one uses; markets not listed here (Handicap) aren't simulated
+PARLAY_LEG_MARKETS = {
+    "1x2": "1X2", "match winner": "1X2", "h2h": "1X2",
+    "over/under": "Over/Under", "over/under 2.5": "Over/Under", "totals": "Over/Under",
+    "btts": "BTTS", "both teams score": "BTTS",
+}
+PARLAY_LEG_SELECTIONS = {
+    "1X2": {"home": "home", "home win": "home", "1": "home", "draw": "draw", "x": "draw",
+            "away": "away", "away win": "away", "2": "away"},
+    "Over/Under": {"over": "over_2.5", "over 2.5": "over_2.5", "over 2.5 goals": "over_2.5",
+                   "under": "under_2.5", "under 2.5": "under_2.5", "under 2.5 goals": "under_2.5"},
+    "BTTS": {"yes": "btts_yes", "btts yes": "btts_yes", "both teams score - yes": "btts_yes",
+             "no": "btts_no", "btts no": "btts_no", "both teams score - no": "btts_no"},
+}
+
+def parlay_leg_outcome(item: ParlayItem) -> Optional[str]:
+    """The simulated outcome a parlay selection backs, or None for markets the match model doesn't cover.
     
+    Dispatches on the item's market, then matches exact selection labels or
+    "<team> Win". Items without a market are matched against every market's labels."""
+    text = " ".join((item.selection_name or item.selection or "").lower().split())
+    market = PARLAY_LEG_MARKETS.get((item.market or "").strip().lower())
+    if item.market and market is None:
+        return None
+    for name in ([market] if market else PARLAY_LEG_SELECTIONS):
+        outcome = PARLAY_LEG_SELECTIONS[name].get(text)
+        if outcome:
+            return outcome
+    if market in (None, "1X2"):
+        for team, outcome in ((item.home_team, "home"), (item.away_team, "away")):
+            team = " ".join((team or "").lower().split())
+            if team and text in (team, f"{team} win"):
+                return outcome
+    return None
+
+def consensus_leg_probabilities(odds: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """Margin-free probabilities of a match's simulated outcomes, from its odds consensus"""
+    probabilities = {}
+    for market, entry in ((odds or {}).get("consensus") or {}).items():
+        for selection, outcome in CONSENSUS_LEG_OUTCOMES.get(market, {}).items():
+            if selection in entry["probabilities"]:
+                probabilities[outcome] = entry["probabilities"][selection]
+    return probabilities
+
+async def price_parlay(request: ParlayRequest) -> Tuple[float, float, Dict[str, Any]]:
+    """Combined odds, win probability (%) and the Monte Carlo summary of a parlay"""
     combined_odds = 1.0
     for item in request.items:
         # Support both new (price) and old (odds) field names
         item_odds = item.price if item.price is not None else item.odds
         if item_odds is None:
             raise HTTPException(status_code=400, detail="Missing odds/price for parlay item")
+        if item_odds <= 1:
+            raise HTTPException(status_code=400, detail="Parlay prices must be greater than 1")
         combined_odds *= item_odds
+    trials = min(max(request.simulations or PARLAY_SIMULATIONS, 1000), PARLAY_MAX_SIMULATIONS)
+    
+    index = await load_match_index("SCHEDULED", "summary")
+    legs_by_match: Dict[str, List[ParlayItem]] = {}
+    for item in request.items:
+        legs_by_match.setdefault(item.match_id, []).append(item)
+    
+    match_cells: List[np.ndarray] = []
+    modeled_legs: List[Tuple[int, str]] = []
+    independent_legs: List[float] = []
+    leg_reports = []
+    for match_id, items in legs_by_match.items():
+        match = index.by_id.get(match_id) or {}
+        fair = consensus_leg_probabilities(match.get("odds"))
+        outcomes = [parlay_leg_outcome(item) for item in items]
+        
+        if match.get("sport") == "football" and "home" in fair:
+            cells, source = fit_goal_model(fair), "goal_model"
+        else:
+            # No goal model: the consensus (or the leg's own price) per outcome, independent across markets
+            marginals = dict(fair)
+            for item, outcome in zip(items, outcomes):
+                if outcome and outcome not in marginals:
+                    marginals[outcome] = 1 / (item.price if item.price is not None else item.odds)
+            cells, source = independent_match_cells(marginals), "consensus" if fair else "price"
+        
+        match_index = len(match_cells)
+        match_cells.append(cells)
+        for item, outcome in zip(items, outcomes):
+            price = item.price if item.price is not None else item.odds
+            if outcome:
+                modeled_legs.append((match_index, outcome))
+                probability, leg_source = float(cells[LEG_OUTCOME_MASKS[outcome]].sum()), source
+            else:
+                probability, leg_source = 1 / price, "price"
+                independent_legs.append(probability)
+            leg_reports.append({
+                "match_id": match_id,
+                "selection": item.selection_name or item.selection,
+                "outcome": outcome,
+                "price": price,
+                "probability": round(probability * 100, 2),
+                "edge": round((probability * price - 1) * 100, 2),
+                "source": leg_source,
+            })
+    
+    # CPU-bound; keep it off the event loop
+    histogram = await asyncio.to_thread(simulate_parlay, match_cells, modeled_legs, independent_legs, trials)
+    win_probability = histogram[-1] / trials
+    payout = request.stake * combined_odds
+    variance = payout ** 2 * win_probability * (1 - win_probability)
+    simulation = {
+        "trials": trials,
+        "win_probability": round(win_probability * 100, 3),
+        "standard_error": round(math.sqrt(win_probability * (1 - win_probability) / trials) * 100, 3),
+        "implied_probability": round(100 / combined_odds, 3),
+        "fair_odds": round(1 / win_probability, 2) if win_probability > 0 else None,
+        "stake": request.stake,
+        "expected_return": round(payout * win_probability, 2),
+        "expected_value": round(payout * win_probability - request.stake, 2),
+        "variance": round(variance, 2),
+        "std_dev": round(math.sqrt(variance), 2),
+        "return_distribution": [
+            {"return": 0.0, "probability": round((1 - win_probability) * 100, 3)},
+            {"return": round(payout, 2), "probability": round(win_probability * 100, 3)},
+        ],
+        "legs_won_distribution": [round(count / trials * 100, 3) for count in histogram.tolist()],
+        "legs": leg_reports,
+    }
+    return combined_odds, win_probability * 100, simulation
+
+# Parlay optimizer - searches the slate's priced outcomes (best price vs margin-free
+# consensus probability) for the best N-leg parlays, at most one leg per match
+PARLAY_OPTIMIZER_OBJECTIVES = ("ev", "kelly")
+PARLAY_OPTIMIZER_MAX_LEGS = 10
+PARLAY_OPTIMIZER_MAX_NODES = 500_000  # branch-and-bound gives up widening the search past this
+PARLAY_BEAM_WIDTH = int(os.environ.get('PARLAY_BEAM_WIDTH', '128'))
+OUTCOME_SELECTIONS = {
+    "home": ("Match Winner", "Home", "Home Win", "1X2"),
+    "draw": ("Match Winner", "Draw", "Draw", "1X2"),
+    "away": ("Match Winner", "Away", "Away Win", "1X2"),
+    "over_2.5": ("Over/Under 2.5", "Over", "Over 2.5", "Over/Under"),
+    "under_2.5": ("Over/Under 2.5", "Under", "Under 2.5", "Over/Under"),
+    "btts_yes": ("Both Teams Score", "Yes", "BTTS Yes", "BTTS"),
+    "btts_no": ("Both Teams Score", "No", "BTTS No", "BTTS"),
+}
+
+class ParlayCandidates:
+    """Priced outcomes as columns, sorted by log(probability * price) descending"""
+    __slots__ = ("legs", "log_values", "log_probabilities", "matches", "leagues", "suffix_values", "suffix_max_probability")
+
+    def __init__(self, legs: List[Dict[str, Any]]):
+        legs = sorted(legs, key=lambda leg: leg["probability"] * leg["price"], reverse=True)
+        self.legs = legs
+        self.log_probabilities = np.log(np.array([leg["probability"] for leg in legs], dtype=np.float64))
+        self.log_values = self.log_probabilities + np.log(np.array([leg["price"] for leg in legs], dtype=np.float64))
+        match_ids = {leg["match_id"]: i for i, leg in enumerate(legs)}
+        league_ids = {leg["league"]: i for i, leg in enumerate(legs)}
+        self.matches = np.array([match_ids[leg["match_id"]] for leg in legs], dtype=np.int64)
+        self.leagues = np.array([league_ids[leg["league"]] for leg in legs], dtype=np.int64)
+        # suffix_values[i]: sum of log values from i on (prefix sums, read backwards);
+        # suffix_max_probability[i]: best log probability among candidates i..end
+        self.suffix_values = np.r_[0.0, np.cumsum(self.log_values)]
+        self.suffix_max_probability = np.r_[np.maximum.accumulate(self.log_probabilities[::-1])[::-1], -np.inf]
+
+def parlay_candidates(index: "MatchIndex", min_odds: float, sport: Optional[str]) -> ParlayCandidates:
+    legs = []
+    for match in index.matches:
+        if sport and match.get("sport") != sport:
+            continue
+        odds = parse_odds(match.get("odds"))
+        fair = consensus_leg_probabilities(odds)
+        for outcome, probability in fair.items():
+            market, selection, selection_name, market_type = OUTCOME_SELECTIONS[outcome]
+            price = ((odds or {}).get(market) or {}).get(selection)
+            if not price or price < min_odds or probability <= 0:
+                continue
+            legs.append({
+                "match_id": match["id"],
+                "home_team": match.get("home_team"),
+                "away_team": match.get("away_team"),
+                "match_name": f"{match.get('home_team')} vs {match.get('away_team')}",
+                "league": match.get("league_code") or match.get("league"),
+                "selection_name": selection_name,
+                "market": market_type,
+                "price": price,
+                "probability": probability,
+            })
+    return ParlayCandidates(legs)
+
+def kelly_fraction(log_value: np.ndarray, log_probability: np.ndarray) -> np.ndarray:
+    """Kelly stake fraction of a bet with win probability P and decimal odds O: (PO - 1) / (O - 1)"""
+    odds = np.exp(log_value - log_probability)
+    return (np.exp(log_value) - 1) / np.maximum(odds - 1, 1e-9)
+
+def branch_and_bound_parlays(candidates: ParlayCandidates, legs: int, max_per_league: Optional[int],
+                             log_target: float, results: int) -> Tuple[List[Tuple[float, Tuple[int, ...]]], int]:
+    """Exact top parlays by expected value (the product of probability * price).
+    
+    Candidates are visited in descending value, so a branch is cut as soon as the
+    next-best legs cannot beat the current results or reach the target probability."""
+    best: List[Tuple[float, Tuple[int, ...]]] = []  # min-heap of (log value, candidate indices)
+    nodes = 0
+    n = len(candidates.legs)
     
-    probability = (1 / combined_odds) * 100
+    def search(start: int, chosen: List[int], log_value: float, log_probability: float,
+               used_matches: set, league_counts: Dict[int, int]):
+        nonlocal nodes
+        need = legs - len(chosen)
+        if need == 0:
+            entry = (log_value, tuple(chosen))
+            if len(best) < results:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+            return
+        threshold = best[0][0] if len(best) == results else -math.inf
+        for i in range(start, n - need + 1):
+            nodes += 1
+            if nodes > PARLAY_OPTIMIZER_MAX_NODES:
+                return
+            # Neither bound improves further along (values and best probabilities only fall)
+            if log_value + candidates.suffix_values[i + need] - candidates.suffix_values[i] <= threshold:
+                break
+            if log_probability + need * candidates.suffix_max_probability[i] < log_target:
+                break
+            match, league = int(candidates.matches[i]), int(candidates.leagues[i])
+            if match in used_matches or (max_per_league and league_counts.get(league, 0) >= max_per_league):
+                continue
+            next_probability = log_probability + candidates.log_probabilities[i]
+            # The last leg has to reach the target on its own; earlier ones with the best legs left
+            reachable = next_probability
+            if need > 1:
+                reachable += (need - 1) * candidates.suffix_max_probability[i + 1]
+            if reachable < log_target:
+                continue
+            used_matches.add(match)
+            league_counts[league] = league_counts.get(league, 0) + 1
+            chosen.append(i)
+            search(i + 1, chosen, log_value + candidates.log_values[i], next_probability, used_matches, league_counts)
+            chosen.pop()
+            league_counts[league] -= 1
+            used_matches.discard(match)
+            threshold = best[0][0] if len(best) == results else -math.inf
+    
+    search(0, [], 0.0, 0.0, set(), {})
+    return sorted(best, reverse=True), nodes
+
+def beam_search_parlays(candidates: ParlayCandidates, legs: int, max_per_league: Optional[int],
+                        log_target: float, results: int, width: int = PARLAY_BEAM_WIDTH
+                        ) -> Tuple[List[Tuple[float, Tuple[int, ...]]], int]:
+    """Top parlays by Kelly fraction, keeping the best `width` partial parlays per leg added.
+    
+    Each step scores every (partial parlay, next candidate) pair as one matrix."""
+    n = len(candidates.legs)
+    positions = np.arange(n)
+    chosen = np.zeros((1, 0), dtype=np.int64)  # one row of candidate indices per partial parlay
+    log_values, log_probabilities = np.zeros(1), np.zeros(1)
+    nodes = 0
+    for step in range(legs):
+        need_after = legs - step - 1
+        # Candidates are added in index order so each combination is built once
+        last = chosen[:, -1] if step else np.full(len(chosen), -1)
+        ok = (positions[None, :] > last[:, None]) & (positions[None, :] < n - need_after)
+        for column in chosen.T:
+            ok &= candidates.matches[None, :] != candidates.matches[column][:, None]
+        if max_per_league and step:
+            league_counts = sum((candidates.leagues[None, :] == candidates.leagues[column][:, None]).astype(np.int64)
+                                for column in chosen.T)
+            ok &= league_counts < max_per_league
+        next_probabilities = log_probabilities[:, None] + candidates.log_probabilities[None, :]
+        reachable = next_probabilities
+        if need_after:
+            reachable = reachable + need_after * candidates.suffix_max_probability[None, 1:]
+        ok &= reachable >= log_target
+        rows, columns = np.nonzero(ok)
+        nodes += len(rows)
+        if not len(rows):
+            return [], nodes
+        next_values = log_values[rows] + candidates.log_values[columns]
+        next_probabilities = next_probabilities[rows, columns]
+        scores = kelly_fraction(next_values, next_probabilities)
+        keep = np.argpartition(-scores, width)[:width] if len(scores) > width else np.arange(len(scores))
+        keep = keep[np.argsort(-scores[keep], kind="stable")]
+        chosen = np.column_stack([chosen[rows[keep]], columns[keep]])
+        log_values, log_probabilities = next_values[keep], next_probabilities[keep]
+    scores = kelly_fraction(log_values, log_probabilities)
+    return [(float(score), tuple(row)) for score, row in zip(scores[:results].tolist(), chosen[:results].tolist())], nodes
+
+@api_router.post("/parlay/calculate")
+async def calculate_parlay(request: ParlayRequest):
+    """Calculate parlay odds and probability.
+    
+    The probability comes from a Monte Carlo simulation over margin-free leg
+    probabilities, with legs on the same match simulated jointly."""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No items in parlay")
+    
+    combined_odds, probability, simulation = await price_parlay(request)
     
     if len(request.items) <= 2 and probability > 20:
         risk = "Low"
@@ -1144,24 +3707,78 @@ async def calculate_parlay(request: ParlayRequest):
     else:
         risk = "High"
     
-    potential_return = 10 * combined_odds
+    potential_return = request.stake * combined_odds
     
     return ParlayResponse(
         items=request.items,
         combined_odds=round(combined_odds, 2),
         probability=round(probability, 2),
         potential_return=round(potential_return, 2),
-        risk_assessment=risk
+        risk_assessment=risk,
+        simulation=simulation
     )
 
+@api_router.post("/parlay/optimize")
+async def optimize_parlay(request: ParlayOptimizeRequest):
+    """Find the best parlays on the current slate by expected value or Kelly fraction.
+    
+    Legs are priced at the best available odds against the margin-free consensus
+    probability, with at most one leg per match so legs are independent."""
+    if not 2 <= request.legs <= PARLAY_OPTIMIZER_MAX_LEGS:
+        raise HTTPException(status_code=400, detail=f"legs must be between 2 and {PARLAY_OPTIMIZER_MAX_LEGS}")
+    if request.objective not in PARLAY_OPTIMIZER_OBJECTIVES:
+        raise HTTPException(status_code=400, detail=f"objective must be one of {', '.join(PARLAY_OPTIMIZER_OBJECTIVES)}")
+    if request.target_probability is not None and not 0 < request.target_probability <= 100:
+        raise HTTPException(status_code=400, detail="target_probability must be a percentage above 0")
+    results = min(max(request.results, 1), 20)
+    started = time.perf_counter()
+    
+    index = await load_match_index("SCHEDULED", "summary")
+    candidates = parlay_candidates(index, request.min_odds, request.sport)
+    log_target = math.log(request.target_probability / 100) if request.target_probability else -math.inf
+    search = branch_and_bound_parlays if request.objective == "ev" else beam_search_parlays
+    found, nodes = search(candidates, request.legs, request.max_per_league, log_target, results)
+    
+    parlays = []
+    for _, chosen in found:
+        legs = [candidates.legs[i] for i in chosen]
+        combined_odds = math.prod(leg["price"] for leg in legs)
+        probability = math.prod(leg["probability"] for leg in legs)
+        parlays.append({
+            "items": [
+                {**leg, "probability": round(leg["probability"] * 100, 2),
+                 "edge": round((leg["probability"] * leg["price"] - 1) * 100, 2)}
+                for leg in legs
+            ],
+            "combined_odds": round(combined_odds, 2),
+            "probability": round(probability * 100, 3),
+            "expected_value": round((probability * combined_odds - 1) * 100, 2),  # % of stake
+            "kelly_fraction": round(max(0.0, (probability * combined_odds - 1) / (combined_odds - 1)), 4),
+        })
+    
+    return {
+        "objective": request.objective,
+        "candidates": len(candidates.legs),
+        "parlays": parlays,
+        "search": {"nodes": nodes, "ms": round((time.perf_counter() - started) * 1000, 1)},
+    }
+
 @api_router.get("/standings/{league_code}")
-async def get_standings(league_code: str):
+async def get_standings(request: Request, league_code: str):
     """Get league standings"""
+    derived_key, version, payload = await load_standings(league_code)
+    return serialized_response(request, get_serialized(derived_key, version, payload))
+
+async def load_standings(league_code: str) -> Tuple[Any, Any, Dict[str, Any]]:
+    """Build a league table; returns (derived key, version, payload)"""
     
     # Check if it's a basketball league
     if league_code in BASKETBALL_LEAGUES or league_code == "EURO" or league_code == "120":
         actual_id = "120" if league_code == "EURO" else league_code
-        data = await fetch_api_basketball(f"/standings?league={actual_id}&season=2024-2025")
+        endpoint = f"/standings?league={actual_id}&season=2024-2025"
+        data = await fetch_api_basketball(endpoint)
+        derived_key = ("standings", league_code)
+        version = snapshot_version(f"basketball:{endpoint}", data)
         standings_response = data.get("response", [])
         
         standings = []
@@ -1185,7 +3802,7 @@ async def get_standings(league_code: str):
                         "form": list(team_standing.get("form", "")[:5]) if team_standing.get("form") else []
                     })
         
-        return {
+        return derived_key, version, {
             "standings": sorted(standings, key=lambda x: x["position"]),
             "league": BASKETBALL_LEAGUES.get(actual_id, {}).get("name", "EuroLeague")
         }
@@ -1194,7 +3811,10 @@ async def get_standings(league_code: str):
     if league_code not in FOOTBALL_LEAGUES:
         raise HTTPException(status_code=404, detail="League not found")
     
-    data = await fetch_football_data(f"/competitions/{league_code}/standings")
+    endpoint = f"/competitions/{league_code}/standings"
+    data = await fetch_football_data(endpoint)
+    derived_key = ("standings", league_code)
+    version = snapshot_version(f"fd:{endpoint}", data)
     standings_data = data.get("standings", [])
     
     standings = []
@@ -1216,7 +3836,7 @@ async def get_standings(league_code: str):
                 "form": list(team.get("form", "")[:5]) if team.get("form") else []
             })
     
-    return {
+    return derived_key, version, {
         "standings": standings,
         "league": FOOTBALL_LEAGUES[league_code]["name"]
     }
@@ -1226,20 +3846,16 @@ async def save_parlay(request: ParlayRequest):
     """Save a parlay bet"""
     parlay_id = str(uuid.uuid4())
     
-    combined_odds = 1.0
-    for item in request.items:
-        # Support both new (price) and old (odds) field names
-        item_odds = item.price if item.price is not None else item.odds
-        if item_odds is None:
-            raise HTTPException(status_code=400, detail="Missing odds/price for parlay item")
-        combined_odds *= item_odds
+    combined_odds, probability, simulation = await price_parlay(request)
     
     parlay_doc = {
         "id": parlay_id,
         "items": [item.model_dump() for item in request.items],
         "created_at": datetime.now(timezone.utc).isoformat(),
         "combined_odds": round(combined_odds, 2),
-        "probability": round((1 / combined_odds) * 100, 2)
+        "probability": round(probability, 2),
+        "expected_value": simulation["expected_value"],
+        "simulation": {key: value for key, value in simulation.items() if key != "legs"}
     }
     
     # Insert into MongoDB (this will add _id field)
@@ -1265,6 +3881,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_http_clients():
+    for host in UPSTREAM_HOSTS:
+        get_http_client(host)
+    logger.info(f"Created {len(http_clients)} upstream HTTP clients (HTTP/2: {HTTP2_ENABLED and HTTP2_AVAILABLE})")
+
+@app.on_event("startup")
+async def startup_cache_indexes():
+    try:
+        # MongoDB drops L2 entries once expires_at has passed
+        await asyncio.wait_for(db.upstream_cache.create_index("expires_at", expireAfterSeconds=0), 5)
+        await asyncio.wait_for(db.ai_analyses.create_index("expires_at", expireAfterSeconds=0), 5)
+        await asyncio.wait_for(db.ai_analyses.create_index([("match_id", 1), ("expires_at", 1)]), 5)
+        await asyncio.wait_for(db.odds_history.create_index("expires_at", expireAfterSeconds=0), 5)
+        await asyncio.wait_for(db.odds_history.create_index([("event_id", 1), ("start", 1)]), 5)
+        await asyncio.wait_for(db.odds_history.create_index([("sport_key", 1), ("kickoff", 1)]), 5)
+        await asyncio.wait_for(db.odds_changes.create_index("expires_at", expireAfterSeconds=0), 5)
+        await asyncio.wait_for(db.odds_changes.create_index("end"), 5)
+    except Exception as e:
+        logger.warning(f"Could not create L2 cache index: {e}")
+
+@app.on_event("startup")
+async def startup_team_aliases():
+    try:
+        aliases = await asyncio.wait_for(db.team_aliases.find({}, {"_id": 0}).to_list(5000), 5)
+    except Exception as e:
+        logger.warning(f"Could not load team aliases: {e}")
+        return
+    for doc in aliases:
+        add_team_alias(doc["alias"], doc["canonical"])
+    logger.info(f"Loaded {len(aliases)} team aliases")
+
+@app.on_event("startup")
+async def startup_background_refresh():
+    global refresh_task
+    if BACKGROUND_REFRESH:
+        refresh_task = asyncio.create_task(refresh_loop())
+
+@app.on_event("startup")
+async def startup_odds_recorder():
+    global odds_recorder_task
+    if ODDS_RECORDER:
+        odds_recorder_task = asyncio.create_task(odds_recorder_loop())
+
+@app.on_event("startup")
+async def startup_analysis_precompute():
+    if AI_PRECOMPUTE and EMERGENT_LLM_KEY:
+        precompute_tasks.append(asyncio.create_task(precompute_scan_loop()))
+        for _ in range(AI_PRECOMPUTE_CONCURRENCY):
+            precompute_tasks.append(asyncio.create_task(precompute_worker()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if refresh_task:
+        refresh_task.cancel()
+    if odds_recorder_task:
+        odds_recorder_task.cancel()
+    for task in precompute_tasks:
+        task.cancel()
+    for http_client in http_clients.values():
+        await http_client.aclose()
+    http_clients.clear()
     client.close()
+
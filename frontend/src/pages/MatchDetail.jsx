@@ -1,6 +1,5 @@
 import { useState, useEffect } from "react";
 import { useParams, useNavigate } from "react-router-dom";
-import axios from "axios";
 import { toast } from "sonner";
 import {
   ArrowLeft,
@@ -38,21 +37,61 @@ export default function MatchDetail() {
   const { addToParlay, parlayItems } = useParlay();
   const [match, setMatch] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [analysisPending, setAnalysisPending] = useState(false);
+  const [newsSummary, setNewsSummary] = useState("");
 
   useEffect(() => {
     fetchMatchDetail();
   }, [matchId]);
 
+  // The stream sends the match first, then the news summary and AI analysis as they finish
+  const handleStreamEvent = ({ event, data }) => {
+    switch (event) {
+      case "match":
+        setMatch(data);
+        setLoading(false);
+        break;
+      case "news":
+        setNewsSummary(data);
+        break;
+      case "analysis":
+        setMatch((prev) => ({ ...prev, ai_analysis: data }));
+        break;
+      case "error":
+        toast.error("AI analysis unavailable");
+        break;
+      default:
+        break;
+    }
+  };
+
   const fetchMatchDetail = async () => {
     setLoading(true);
+    setMatch(null);
+    setNewsSummary("");
+    setAnalysisPending(true);
     try {
-      const response = await axios.get(`${API}/matches/${matchId}`);
-      setMatch(response.data);
+      const response = await fetch(`${API}/matches/${matchId}/stream`);
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        lines.filter(Boolean).forEach((line) => handleStreamEvent(JSON.parse(line)));
+      }
     } catch (error) {
       console.error("Error fetching match:", error);
       toast.error("Failed to load match details");
     } finally {
       setLoading(false);
+      setAnalysisPending(false);
     }
   };
 
@@ -719,6 +758,31 @@ export default function MatchDetail() {
                     </Card>
                   )}
                 </div>
+              ) : analysisPending ? (
+                <div className="space-y-6">
+                  <Card className="bg-zinc-900 border-zinc-800">
+                    <CardContent className="p-6 space-y-4">
+                      <p className="text-sm text-zinc-500">Generating AI analysis...</p>
+                      <Skeleton className="h-16 w-full bg-zinc-800" />
+                      <Skeleton className="h-24 w-full bg-zinc-800" />
+                    </CardContent>
+                  </Card>
+                  {newsSummary && (
+                    <Card className="bg-zinc-900 border-zinc-800">
+                      <CardHeader>
+                        <CardTitle className="flex items-center gap-2 text-white">
+                          <Newspaper className="w-5 h-5 text-blue-500" />
+                          Latest News & Updates
+                        </CardTitle>
+                      </CardHeader>
+                      <CardContent>
+                        <p className="text-zinc-300 leading-relaxed text-sm whitespace-pre-wrap">
+                          {newsSummary}
+                        </p>
+                      </CardContent>
+                    </Card>
+                  )}
+                </div>
               ) : (
                 <Card className="bg-zinc-900 border-zinc-800">
                   <CardContent className="p-8 text-center">
@@ -0,0 +1,11 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py reads these at import time; the Motor client only connects on first use
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+os.environ.setdefault("BACKGROUND_REFRESH", "false")
+os.environ.setdefault("AI_PRECOMPUTE", "false")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,103 @@
+import gzip
+import json
+
+import brotli
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import server
+
+DATA = {"matches": [{"id": f"fd_{i}", "home_team": "Arsenal FC", "away_team": "Chelsea FC"} for i in range(50)]}
+PAYLOAD = server.SerializedPayload(DATA)
+SMALL_PAYLOAD = server.SerializedPayload({"ok": True})
+
+app = FastAPI()
+
+
+@app.get("/data")
+def data(request: Request):
+    return server.serialized_response(request, PAYLOAD)
+
+
+@app.get("/small")
+def small(request: Request):
+    return server.serialized_response(request, SMALL_PAYLOAD)
+
+
+client = TestClient(app)
+
+
+def get(path="/data", **headers):
+    return client.get(path, headers={key.replace("_", "-"): value for key, value in headers.items()})
+
+
+@pytest.mark.parametrize("accept_encoding, encoding", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("*", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("identity", None),
+    ("gzip;q=0", None),
+    ("", None),
+])
+def test_choose_encoding(accept_encoding, encoding):
+    assert server.choose_encoding(accept_encoding) == encoding
+
+
+@pytest.mark.parametrize("accept_encoding, encoding, decompress", [
+    ("gzip", "gzip", gzip.decompress),
+    ("br, gzip", "br", brotli.decompress),
+])
+def test_compressed_body_decodes_to_the_payload(accept_encoding, encoding, decompress):
+    response = get(accept_encoding=accept_encoding)
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["etag"] == f'"{PAYLOAD.digest}-{encoding}"'
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert json.loads(decompress(PAYLOAD.encoded(encoding))) == DATA
+    assert response.json() == DATA
+
+
+def test_small_payload_is_sent_uncompressed():
+    response = get("/small", accept_encoding="br, gzip")
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == f'"{SMALL_PAYLOAD.digest}"'
+    assert response.json() == {"ok": True}
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip", "br", "identity"])
+def test_matching_if_none_match_returns_304(accept_encoding):
+    etag = get(accept_encoding=accept_encoding).headers["etag"]
+
+    response = get(accept_encoding=accept_encoding, if_none_match=etag)
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_weak_and_listed_etags_match():
+    etag = get(accept_encoding="gzip").headers["etag"]
+
+    assert get(accept_encoding="gzip", if_none_match=f'"stale", W/{etag}').status_code == 304
+    assert get(accept_encoding="gzip", if_none_match="*").status_code == 304
+
+
+def test_etag_of_another_encoding_does_not_match():
+    gzip_etag = get(accept_encoding="gzip").headers["etag"]
+
+    response = get(accept_encoding="br", if_none_match=gzip_etag)
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+
+
+def test_etag_changes_with_the_payload():
+    changed = server.SerializedPayload({**DATA, "matches": DATA["matches"][:-1]})
+
+    assert changed.etag("gzip") != PAYLOAD.etag("gzip")
+    assert server.SerializedPayload(DATA).etag("gzip") == PAYLOAD.etag("gzip")
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import server
+
+BOOKS = [
+    [1 / 1.90, 1 / 1.95],
+    [1 / 2.10, 1 / 3.40, 1 / 3.60],
+    [1 / 1.25, 1 / 6.00, 1 / 11.0],
+]
+
+
+@pytest.mark.parametrize("method", ["multiplicative", "power", "shin"])
+@pytest.mark.parametrize("implied", BOOKS, ids=["two-way", "even-three-way", "longshot-three-way"])
+def test_fair_probabilities_sum_to_one(method, implied):
+    implied = np.array([implied], dtype=np.float64)
+
+    fair = server.remove_margin(implied, method)
+
+    assert fair.sum() == pytest.approx(1)
+    assert np.all(fair < implied)
+    assert list(np.argsort(fair[0])) == list(np.argsort(implied[0]))
+
+
+def test_shin_matches_additive_for_two_way_markets():
+    implied = np.array([[1 / 1.5, 1 / 2.6]])
+    additive = implied - (implied.sum() - 1) / 2
+
+    assert server.remove_margin(implied, "shin") == pytest.approx(additive, abs=1e-6)
+
+
+@pytest.mark.parametrize("method", ["power", "shin"])
+def test_longshots_carry_more_of_the_margin(method):
+    implied = np.array([[1 / 1.25, 1 / 6.0, 1 / 11.0]])
+
+    fair = server.remove_margin(implied, method)
+    multiplicative = server.remove_margin(implied, "multiplicative")
+
+    assert fair[0, 0] > multiplicative[0, 0]
+    assert fair[0, 2] < multiplicative[0, 2]
+
+
+def test_rows_are_solved_independently():
+    rows = np.array([[1 / 1.9, 1 / 1.9], [1 / 1.5, 1 / 2.6]])
+
+    fair = server.remove_margin(rows, "shin")
+
+    assert fair[0] == pytest.approx([0.5, 0.5])
+    assert fair[1] == pytest.approx(server.remove_margin(rows[1:], "shin")[0])
@@ -0,0 +1,53 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def make_matches():
+    return [
+        {"id": f"fd_{i}", "match_date": f"2026-10-{10 + i // 3:02d}T15:00:00Z", "league_code": "PL" if i % 2 else "SA",
+         "sport": "football", "has_odds": bool(i % 3), "quick_analysis": {"probability": i * 5},
+         "odds": {"Match Winner": {"Home": 2.0}} if i % 3 else None}
+        for i in range(10)
+    ]
+
+
+def all_pages(index, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        page, cursor = index.page(limit, server.decode_cursor(cursor) if cursor else None, **filters)
+        pages.append([match["id"] for match in page])
+        if cursor is None:
+            return pages
+        cursor = server.encode_cursor(cursor)
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 10, 50])
+def test_pages_cover_every_match_once_in_kickoff_order(limit):
+    index = server.MatchIndex(make_matches())
+
+    pages = all_pages(index, limit)
+
+    assert [match_id for page in pages for match_id in page] == [match["id"] for match in index.matches]
+    assert all(len(page) <= limit for page in pages)
+    assert pages[-1] or len(pages) == 1
+
+
+def test_filters_apply_across_pages():
+    index = server.MatchIndex(make_matches())
+
+    pages = all_pages(index, 2, leagues={"PL"}, with_odds=True, date_from="2026-10-11T00:00:00Z")
+
+    expected = [m["id"] for m in index.matches
+                if m["league_code"] == "PL" and m["has_odds"] and m["match_date"] >= "2026-10-11T00:00:00Z"]
+    assert [match_id for page in pages for match_id in page] == expected
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    key = ("2026-10-12T15:00:00Z", "fd_7")
+
+    assert server.decode_cursor(server.encode_cursor(key)) == key
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor("not-a-cursor")
+    assert error.value.status_code == 400
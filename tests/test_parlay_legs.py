@@ -0,0 +1,36 @@
+import pytest
+
+import server
+
+
+def leg(selection, market=None, home="Sunderland AFC", away="Hannover 96"):
+    return server.ParlayItem(match_id="fd_1", home_team=home, away_team=away, selection_name=selection,
+                             market=market, match_name=f"{home} vs {away}")
+
+
+@pytest.mark.parametrize("selection, market, outcome", [
+    ("Home Win", "1X2", "home"),
+    ("Draw", "1X2", "draw"),
+    ("Away", "1X2", "away"),
+    ("Sunderland AFC Win", "1X2", "home"),
+    ("Hannover 96 Win", "1X2", "away"),
+    ("Over 2.5", "Over/Under", "over_2.5"),
+    ("Under 2.5 Goals", "Over/Under", "under_2.5"),
+    ("BTTS No", "BTTS", "btts_no"),
+    ("Both Teams Score - Yes", "BTTS", "btts_yes"),
+    ("Over 2.5 Goals", None, "over_2.5"),
+    ("Hannover 96 Win", None, "away"),
+])
+def test_selections_map_to_simulated_outcomes(selection, market, outcome):
+    assert server.parlay_leg_outcome(leg(selection, market)) == outcome
+
+
+@pytest.mark.parametrize("selection, market", [
+    ("Home (-0.5)", "Handicap"),
+    ("Over 1.5", "Over/Under"),
+    ("Over 2.5", "1X2"),
+    ("Sunderland AFC Win", "Over/Under"),
+    ("Sunderland Win", "1X2"),
+])
+def test_unmodeled_selections_are_not_simulated(selection, market):
+    assert server.parlay_leg_outcome(leg(selection, market)) is None
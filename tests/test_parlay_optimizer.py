@@ -0,0 +1,69 @@
+import itertools
+import math
+import random
+
+import pytest
+
+import server
+
+
+def random_candidates(rng, matches=12, leagues=3):
+    legs = []
+    for match in range(matches):
+        for _ in range(rng.randint(1, 3)):
+            probability = rng.uniform(0.05, 0.8)
+            legs.append({
+                "match_id": f"m{match}",
+                "league": f"L{match % leagues}",
+                "probability": probability,
+                "price": round(rng.uniform(0.85, 1.15) / probability, 2),
+            })
+    return server.ParlayCandidates(legs)
+
+
+def brute_force(candidates, legs, max_per_league, log_target):
+    found = []
+    for chosen in itertools.combinations(range(len(candidates.legs)), legs):
+        if len({int(candidates.matches[i]) for i in chosen}) < legs:
+            continue
+        if max_per_league:
+            counts = {}
+            for i in chosen:
+                counts[int(candidates.leagues[i])] = counts.get(int(candidates.leagues[i]), 0) + 1
+            if max(counts.values()) > max_per_league:
+                continue
+        if sum(candidates.log_probabilities[i] for i in chosen) < log_target:
+            continue
+        found.append(sum(candidates.log_values[i] for i in chosen))
+    return sorted(found, reverse=True)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_branch_and_bound_matches_brute_force(seed):
+    rng = random.Random(seed)
+    candidates = random_candidates(rng)
+    legs = rng.choice([2, 3])
+    max_per_league = rng.choice([None, 1, 2])
+    target = rng.choice([None, 5, 10, 20])
+    log_target = math.log(target / 100) if target else -math.inf
+
+    found, _ = server.branch_and_bound_parlays(candidates, legs, max_per_league, log_target, 5)
+    expected = brute_force(candidates, legs, max_per_league, log_target)[:5]
+
+    assert [value for value, _ in found] == pytest.approx(expected)
+    for _, chosen in found:
+        assert sum(candidates.log_probabilities[i] for i in chosen) >= log_target
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_beam_search_respects_constraints(seed):
+    rng = random.Random(seed)
+    candidates = random_candidates(rng)
+    log_target = math.log(0.1)
+
+    found, _ = server.beam_search_parlays(candidates, 3, 1, log_target, 5)
+
+    for _, chosen in found:
+        assert len({int(candidates.matches[i]) for i in chosen}) == 3
+        assert len({int(candidates.leagues[i]) for i in chosen}) == 3
+        assert sum(candidates.log_probabilities[i] for i in chosen) >= log_target
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+
+class Upstream:
+    """Football-Data.org behind a mock transport, recording the paths it served"""
+
+    def __init__(self):
+        self.calls = []
+        self.status = 200
+
+    async def handle(self, request):
+        self.calls.append(request.url.path)
+        await asyncio.sleep(0.05)  # long enough for every concurrent caller to pile up
+        if self.status != 200:
+            return httpx.Response(self.status, text="upstream error")
+        return httpx.Response(200, json={"matches": [{"id": 1}]})
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream()
+    monkeypatch.setattr(server, "FOOTBALL_DATA_KEY", "test-key")
+    monkeypatch.setattr(server, "L2_CACHE_ENABLED", False)
+    monkeypatch.setattr(server, "cache", server.TTLCache(100, 1_000_000, {}, 60))
+    monkeypatch.setitem(server.provider_budgets, "football_data", server.ProviderBudget("Football-Data.org", 8, 100))
+    monkeypatch.setitem(server.http_clients, "football_data",
+                        httpx.AsyncClient(transport=httpx.MockTransport(upstream.handle)))
+    return upstream
+
+
+def fetch_concurrently(n, endpoint="/competitions/PL/matches"):
+    async def run():
+        return await asyncio.gather(*(server.fetch_football_data(endpoint) for _ in range(n)))
+    return asyncio.run(run())
+
+
+def test_concurrent_misses_make_one_upstream_call(upstream):
+    results = fetch_concurrently(20)
+
+    assert upstream.calls == ["/v4/competitions/PL/matches"]
+    assert all(result == {"matches": [{"id": 1}]} for result in results)
+    assert not server.inflight_fetches
+
+
+def test_failed_fetch_is_shared_but_not_cached(upstream):
+    upstream.status = 500
+
+    results = fetch_concurrently(10)
+
+    assert results == [{}] * 10
+    assert len(upstream.calls) == 1
+    assert server.cache.peek("fd:/competitions/PL/matches") is None
+
+    upstream.status = 200
+    assert fetch_concurrently(1) == [{"matches": [{"id": 1}]}]
+    assert len(upstream.calls) == 2
+
+
+def test_different_keys_fetch_separately(upstream):
+    async def run():
+        return await asyncio.gather(server.fetch_football_data("/competitions/PL/matches"),
+                                    server.fetch_football_data("/competitions/SA/matches"))
+
+    asyncio.run(run())
+
+    assert sorted(upstream.calls) == ["/v4/competitions/PL/matches", "/v4/competitions/SA/matches"]
@@ -0,0 +1,91 @@
+import time
+
+import server
+
+
+def payload(size=100):
+    return "x" * size
+
+
+def make_cache(**kwargs):
+    options = {"max_entries": 100, "max_bytes": 10_000, "namespace_ttls": {}, "default_ttl": 60}
+    options.update(kwargs)
+    return server.TTLCache(**options)
+
+
+def test_byte_budget_evicts_least_recently_used():
+    entry_size = server.estimate_size(payload())
+    cache = make_cache(max_bytes=3 * entry_size + 10)
+    for key in ("a", "b", "c"):
+        cache.set(key, payload())
+
+    assert cache.get("a") == payload()  # "a" is now the most recently used
+    cache.set("d", payload())
+
+    assert cache.peek("b") is None
+    assert all(cache.peek(key) for key in ("a", "c", "d"))
+    assert cache.total_bytes == 3 * entry_size
+    assert cache.evictions == 1
+
+
+def test_entry_limit_evicts_least_recently_used():
+    cache = make_cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 3)  # replacing an entry makes it the most recent
+    cache.set("c", 4)
+
+    assert cache.peek("b") is None
+    assert (cache.peek("a"), cache.peek("c")) == (3, 4)
+
+
+def test_entry_over_the_byte_budget_is_not_stored():
+    cache = make_cache(max_bytes=500)
+    cache.set("small", payload())
+    cache.set("huge", payload(1000))
+
+    assert cache.peek("huge") is None
+    assert cache.peek("small") == payload()
+    assert cache.total_bytes == server.estimate_size(payload())
+
+
+def test_longest_namespace_prefix_sets_the_ttl():
+    cache = make_cache(namespace_ttls={"odds:": 10, "odds:live:": 2}, default_ttl=60)
+    stored_at = time.time() - 5
+    for key in ("odds:PL", "odds:live:PL", "news:PL"):
+        cache.set(key, key, stored_at)
+
+    assert cache.ttl_for("odds:live:PL") == 2
+    assert cache.get("odds:PL") == "odds:PL"
+    assert cache.get("odds:live:PL") is None
+    assert cache.get("news:PL") == "news:PL"
+
+
+def test_expired_entry_is_served_stale_within_grace():
+    cache = make_cache(default_ttl=10, stale_grace=30)
+    cache.set("key", "data", time.time() - 20)
+
+    assert cache.get("key") is None
+    assert cache.get_stale("key") == "data"
+    assert cache.peek("key") == "data"
+
+
+def test_entry_past_stale_grace_is_dropped():
+    cache = make_cache(default_ttl=10, stale_grace=30)
+    cache.set("key", "data", time.time() - 45)
+
+    assert cache.get_stale("key") is None
+    assert cache.get("key") is None
+    assert cache.peek("key") is None
+    assert cache.expirations == 1
+
+
+def test_entries_past_stale_grace_are_evicted_before_live_ones():
+    cache = make_cache(max_entries=2, default_ttl=10, stale_grace=30)
+    cache.set("dead", 1, time.time() - 45)
+    cache.set("live", 2)
+    cache.set("new", 3)
+
+    assert cache.peek("dead") is None
+    assert (cache.peek("live"), cache.peek("new")) == (2, 3)
+    assert (cache.expirations, cache.evictions) == (1, 0)